@@ -0,0 +1,74 @@
+# Offline fixtures for the benchmarks, built from the recorded CSVs in data/ and scaled synthetically:
+# scale k repeats every city k times (renamed "<City> #<i>"), each copy with its own sensor ids,
+# so rows, sensors and cities all grow k-fold while every row keeps a realistic shape.
+
+import os
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+OPENAQ_CSV = os.path.join(DATA_DIR, "HourlyOpenAQAPI_multi_city.csv")
+OPENMETEO_CSV = os.path.join(DATA_DIR, "Week_Hourly_OpenMeteo_multi_city.csv")
+
+# columns getOpenAQSensors attaches to every hourly record
+SENSOR_COLUMNS = ['Sensor ID', 'Latitude', 'Longitude', 'City', 'Station Name', 'First Seen (UTC)', 'Last Seen (UTC)', 'Timezone']
+HOURLY = ["temperature_2m", "apparent_temperature", "dew_point_2m", "relative_humidity_2m", "precipitation", "wind_speed_10m",
+          "wind_direction_10m", "wind_gusts_10m", "cloud_cover", "shortwave_radiation", "snow_depth", "surface_pressure", "pressure_msl", "uv_index"]
+DAILY_FLOATS = ["temperature_2m_mean", "apparent_temperature_mean", "weather_code"]
+
+def _nest(record):
+    # {"period.datetimeFrom.utc": v} -> {"period": {"datetimeFrom": {"utc": v}}}, the shape /sensors/{id}/hours returns
+    nested = {}
+    for key, value in record.items():
+        if isinstance(value, float) and np.isnan(value):
+            value = None
+        parts = key.split(".")
+        node = nested
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return nested
+
+def _replicas(scale):
+    return [(i, "" if i == 0 else f" #{i}") for i in range(scale)]
+
+def openAQRows(scale):
+    # hourly records as _fetchSensorRows hands them to getHourlyAQData: the nested API record plus the sensor metadata
+    recorded = pd.read_csv(OPENAQ_CSV)
+    apiColumns = [c for c in recorded.columns if c not in SENSOR_COLUMNS]
+    records = [_nest(r) for r in recorded[apiColumns].to_dict(orient="records")]
+    metadata = recorded[SENSOR_COLUMNS].to_dict(orient="records")
+    rows = []
+    for i, suffix in _replicas(scale):
+        for record, meta in zip(records, metadata):
+            rows.append({**record, **meta, "Sensor ID": meta["Sensor ID"] + i * 10_000_000, "City": meta["City"] + suffix})
+    return rows
+
+def cities(scale):
+    # catalog entries for the scaled cities
+    recorded = pd.read_csv(OPENAQ_CSV).drop_duplicates("City")
+    return [
+        {"City": r["City"] + suffix, "Latitude": r["Latitude"], "Longitude": r["Longitude"], "Timezone": r["Timezone"]}
+        for i, suffix in _replicas(scale) for _, r in recorded.iterrows()
+    ]
+
+def openMeteoFrames(scale):
+    # (daily, hourly) the way getOpenMeteoData returns them: UTC "date" column, float32 variables, sunrise/sunset as unix seconds
+    recorded = pd.read_csv(OPENMETEO_CSV)
+    hourly = recorded[["City"] + HOURLY].copy()
+    hourly[HOURLY] = hourly[HOURLY].astype(np.float32)
+    hourly.insert(0, "date", pd.to_datetime(recorded["hourly_datetime (UTC)"], utc=True))
+
+    sunrise = pd.to_datetime(recorded["sunrise_local"], utc=True)
+    sunset = pd.to_datetime(recorded["sunset_local"], utc=True)
+    daily = pd.DataFrame({
+        "City": recorded["City"],
+        "date": sunrise.dt.floor("D"),
+        **{name: recorded[name].astype(np.float32) for name in DAILY_FLOATS},
+        "sunrise": sunrise.astype("int64") // 10**9,
+        "sunset": sunset.astype("int64") // 10**9,
+    }).drop_duplicates(["City", "date"]).reset_index(drop=True)
+
+    def scaled(df):
+        return pd.concat([df.assign(City=df["City"] + suffix) for _, suffix in _replicas(scale)], ignore_index=True)
+    return scaled(daily), scaled(hourly)
@@ -0,0 +1,382 @@
+# Local stand-in for the OpenAQ v3 and Open-Meteo APIs, so concurrency and rate-limit handling can be tuned
+# (and full-scale throughput measured) without spending, or getting banned from, the real quota.
+#
+#   GET /v3/locations            synthetic locations around every catalog city, paginated with limit/page
+#   GET /v3/sensors/{id}/hours   one record per hour in [datetime_from, datetime_to), paginated with limit/page
+#   GET /v1/forecast             Open-Meteo flatbuffers (format=flatbuffers), one length-prefixed message per location
+#
+# Every response carries x-ratelimit-limit/-used/-remaining/-reset for a fixed window per API key; past the quota
+# it answers 429 with Retry-After. --latency-ms/--jitter-ms delay every response and --error-rate answers a share with 5xx.
+#
+#   python -m benchmarks.mock_api --port 8765 --rate-limit 60 --latency-ms 80 --error-rate 0.01
+#   OPENAQ_BASE_URL=http://127.0.0.1:8765/v3 OPENMETEO_URL=http://127.0.0.1:8765/v1/forecast python ingestion.py
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from zoneinfo import ZoneInfo
+
+import flatbuffers
+import numpy as np
+from openmeteo_sdk.Aggregation import Aggregation
+from openmeteo_sdk.Variable import Variable
+
+from pipeline.catalog import loadCities
+
+PARAMETERS = [ # (id, name, units, typical value)
+    (2, "pm25", "µg/m³", 12.0),
+    (1, "pm10", "µg/m³", 25.0),
+    (100, "temperature", "c", 22.0),
+    (98, "relativehumidity", "%", 60.0),
+]
+SENSOR_ID_BASE = 1_000_000 # sensor id = SENSOR_ID_BASE + location index * len(PARAMETERS) + parameter index
+
+class FixedWindowLimiter:
+    # per API key request counter over fixed windows, the way OpenAQ reports its quota
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.windows = {} # key -> (window start, used)
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        # (allowed, headers)
+        with self.lock:
+            now = time.time()
+            start, used = self.windows.get(key, (now, 0))
+            if now - start >= self.window:
+                start, used = now, 0
+            allowed = used < self.limit
+            if allowed:
+                used += 1
+            self.windows[key] = (start, used)
+            reset = max(1, math.ceil(start + self.window - now))
+        headers = {
+            "x-ratelimit-limit": str(self.limit),
+            "x-ratelimit-used": str(used),
+            "x-ratelimit-remaining": str(self.limit - used),
+            "x-ratelimit-reset": str(reset),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(reset)
+        return allowed, headers
+
+def buildLocations(cities, perCity, seed):
+    # deterministic synthetic locations scattered within ~3 km of each city centre, all reporting up to now
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    locations = []
+    for info in cities:
+        for k in range(perCity):
+            index = len(locations)
+            lat = info["Latitude"] + rng.uniform(-0.025, 0.025)
+            lon = info["Longitude"] + rng.uniform(-0.025, 0.025)
+            first = now - timedelta(days=rng.randint(365, 3650))
+            local = ZoneInfo(info["Timezone"])
+            locations.append({
+                "id": 500_000 + index,
+                "name": f"{info['City']} - Mock Station {k + 1}",
+                "locality": info["City"],
+                "timezone": info["Timezone"],
+                "country": {"id": 155, "code": "US", "name": "United States"},
+                "isMobile": False,
+                "isMonitor": True,
+                "coordinates": {"latitude": round(lat, 6), "longitude": round(lon, 6)},
+                "sensors": [
+                    {"id": SENSOR_ID_BASE + index * len(PARAMETERS) + p,
+                     "name": f"{name} {units}",
+                     "parameter": {"id": pid, "name": name, "units": units, "displayName": name.upper()}}
+                    for p, (pid, name, units, _) in enumerate(PARAMETERS)
+                ],
+                "datetimeFirst": {"utc": _utc(first), "local": first.astimezone(local).isoformat()},
+                "datetimeLast": {"utc": _utc(now), "local": now.astimezone(local).isoformat()},
+            })
+    return locations
+
+def _utc(instant):
+    return instant.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _parseTime(value):
+    # the pipeline sends naive "YYYY-MM-DD HH:MM:SS" (treated as UTC) or ISO 8601 with an offset
+    instant = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return instant if instant.tzinfo else instant.replace(tzinfo=timezone.utc)
+
+def hourRecord(sensorId, parameter, start, local):
+    # one /sensors/{id}/hours result; the value is a smooth daily cycle plus sensor specific noise, stable across calls
+    _, name, units, typical = parameter
+    end = start + timedelta(hours=1)
+    rng = random.Random(sensorId * 1_000_003 + int(start.timestamp()) // 3600)
+    value = round(typical * (1 + 0.3 * math.sin(2 * math.pi * (start.hour - 9) / 24)) + rng.gauss(0, typical * 0.05), 2)
+    return {
+        "value": value,
+        "flagInfo": {"hasFlags": False},
+        "parameter": {"id": parameter[0], "name": name, "units": units, "displayName": None},
+        "period": {
+            "label": "1hour",
+            "interval": "01:00:00",
+            "datetimeFrom": {"utc": _utc(start), "local": start.astimezone(local).isoformat()},
+            "datetimeTo": {"utc": _utc(end), "local": end.astimezone(local).isoformat()},
+        },
+        "coordinates": None,
+        "summary": {"min": value, "q02": value, "q25": value, "median": value, "q75": value, "q98": value, "max": value, "avg": value, "sd": None},
+        "coverage": {
+            "expectedCount": 1, "expectedInterval": "01:00:00", "observedCount": 1, "observedInterval": "01:00:00",
+            "percentComplete": 100.0, "percentCoverage": 100.0,
+            "datetimeFrom": {"utc": _utc(start), "local": start.astimezone(local).isoformat()},
+            "datetimeTo": {"utc": _utc(end), "local": end.astimezone(local).isoformat()},
+        },
+    }
+
+# Open-Meteo flatbuffers: field slots of WeatherApiResponse / VariablesWithTime / VariableWithValues in the openmeteo_sdk schema
+# (slot = (vtable offset - 4) / 2 of the generated readers)
+def _variableTable(builder, name, values):
+    match = re.fullmatch(r"(.*?)(?:_(\d+)m)?(_mean)?", name) # temperature_2m_mean -> temperature at 2 m, daily mean
+    base, altitude = match.group(1), int(match.group(2) or 0)
+    aggregation = Aggregation.mean if match.group(3) else Aggregation.none
+    isInt = values.dtype == np.int64
+    vector = builder.CreateNumpyVector(values)
+    builder.StartObject(13)
+    builder.PrependUint8Slot(0, getattr(Variable, base, Variable.undefined), 0)
+    builder.PrependUOffsetTRelativeSlot(4 if isInt else 3, vector, 0)
+    builder.PrependInt16Slot(5, altitude, 0)
+    builder.PrependUint8Slot(6, aggregation, 0)
+    return builder.EndObject()
+
+def _blockTable(builder, start, interval, columns):
+    # one VariablesWithTime block; columns are (name, values) in the order they were requested
+    variables = [_variableTable(builder, name, values) for name, values in columns]
+    builder.StartVector(4, len(variables), 4)
+    for offset in reversed(variables):
+        builder.PrependUOffsetTRelative(offset)
+    vector = builder.EndVector()
+    count = len(columns[0][1]) if columns else 0
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + count * interval, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    return builder.EndObject()
+
+def _series(name, times, seed):
+    # synthetic float32 values with a daily cycle; sunrise/sunset are int64 unix seconds
+    rng = np.random.default_rng(seed)
+    if name == "sunrise":
+        return (times + int(6.5 * 3600)).astype(np.int64)
+    if name == "sunset":
+        return (times + int(19.5 * 3600)).astype(np.int64)
+    typical = { # first matching fragment wins
+        "direction": 180, "gusts": 18, "dew_point": 10, "temperature": 20, "pressure": 1013, "humidity": 60, "cloud": 40,
+        "wind": 10, "radiation": 200, "uv": 3, "precipitation": 0.2, "snow": 0.01, "weather_code": 3,
+    }
+    level = next((v for k, v in typical.items() if k in name), 5)
+    hours = (times // 3600) % 24
+    values = level * (1 + 0.2 * np.sin(2 * np.pi * (hours - 9) / 24)) + rng.normal(0, level * 0.03, len(times))
+    return values.astype(np.float32)
+
+def forecastMessage(lat, lon, tz, hourly, daily, pastDays, forecastDays, locationId):
+    # one length-prefixed WeatherApiResponse the way api.open-meteo.com streams them
+    zone = ZoneInfo(tz)
+    today = datetime.now(zone).replace(hour=0, minute=0, second=0, microsecond=0)
+    first = today - timedelta(days=pastDays)
+    days = max(pastDays + forecastDays, 1)
+    offset = int(today.utcoffset().total_seconds())
+    start = int(first.timestamp())
+    hourTimes = start + 3600 * np.arange(days * 24, dtype=np.int64)
+    dayTimes = start + 86400 * np.arange(days, dtype=np.int64)
+    seed = locationId + start // 86400
+
+    builder = flatbuffers.Builder(1024)
+    hourlyBlock = _blockTable(builder, start, 3600, [(n, _series(n, hourTimes, seed)) for n in hourly]) if hourly else None
+    dailyBlock = _blockTable(builder, start, 86400, [(n, _series(n, dayTimes, seed)) for n in daily]) if daily else None
+    tzName = builder.CreateString(tz)
+    tzAbbrev = builder.CreateString(today.tzname() or "")
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, lat, 0)
+    builder.PrependFloat32Slot(1, lon, 0)
+    builder.PrependFloat32Slot(2, 50.0, 0)
+    builder.PrependFloat32Slot(3, 0.5, 0)
+    builder.PrependInt64Slot(4, locationId, 0)
+    builder.PrependInt32Slot(6, offset, 0)
+    builder.PrependUOffsetTRelativeSlot(7, tzName, 0)
+    builder.PrependUOffsetTRelativeSlot(8, tzAbbrev, 0)
+    if dailyBlock is not None:
+        builder.PrependUOffsetTRelativeSlot(10, dailyBlock, 0)
+    if hourlyBlock is not None:
+        builder.PrependUOffsetTRelativeSlot(11, hourlyBlock, 0)
+    builder.Finish(builder.EndObject())
+    body = bytes(builder.Output())
+    return len(body).to_bytes(4, "little") + body
+
+def _listParam(query, name):
+    # Open-Meteo takes lists as comma separated values or as repeated keys
+    return [item for value in query.get(name, []) for item in value.split(",") if item]
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real APIs
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+    def _send(self, status, body, contentType="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        server.count(url.path)
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if url.path.startswith("/v1/forecast"):
+            limiter, key = server.meteoLimiter, self.client_address[0]
+        else:
+            limiter, key = server.openaqLimiter, self.headers.get("X-API-Key") or "anonymous"
+        allowed, headers = limiter.hit(key)
+        if not allowed:
+            server.count("429")
+            return self._json(429, {"detail": "Too many requests"} if limiter is server.openaqLimiter else {"error": True, "reason": "Too many requests"}, headers)
+        if random.random() < server.errorRate:
+            server.count("5xx")
+            return self._json(random.choice([500, 502, 503]), {"detail": "Injected error"}, headers)
+
+        try:
+            if url.path == "/v3/locations":
+                return self._locations(query, headers)
+            match = re.fullmatch(r"/v3/sensors/(\d+)/hours", url.path)
+            if match:
+                return self._hours(int(match.group(1)), query, headers)
+            if url.path == "/v1/forecast":
+                return self._forecast(query, headers)
+        except (KeyError, ValueError) as err:
+            return self._json(400, {"detail": f"Bad request: {err}", "error": True, "reason": str(err)}, headers)
+        self._json(404, {"detail": "Not found"}, headers)
+
+    def _page(self, query, default=100):
+        return int(query.get("limit", [default])[0]), int(query.get("page", [1])[0])
+
+    def _locations(self, query, headers):
+        limit, page = self._page(query)
+        locations = self.server.locations
+        results = locations[(page - 1) * limit: page * limit]
+        meta = {"name": "openaq-api", "website": "/", "page": page, "limit": limit, "found": len(locations)}
+        self._json(200, {"meta": meta, "results": results}, headers)
+
+    def _hours(self, sensorId, query, headers):
+        sensor = self.server.sensors.get(sensorId)
+        if sensor is None:
+            return self._json(404, {"detail": f"Sensor {sensorId} not found"}, headers)
+        location, parameter = sensor
+        limit, page = self._page(query)
+        start = _parseTime(query["datetime_from"][0]).replace(minute=0, second=0, microsecond=0)
+        end = _parseTime(query["datetime_to"][0])
+        hours = max(0, math.ceil((end - start).total_seconds() / 3600))
+        first = (page - 1) * limit
+        local = ZoneInfo(location["timezone"])
+        results = [hourRecord(sensorId, parameter, start + timedelta(hours=h), local) for h in range(first, min(first + limit, hours))]
+        meta = {"name": "openaq-api", "website": "/", "page": page, "limit": limit, "found": hours}
+        self._json(200, {"meta": meta, "results": results}, headers)
+
+    def _forecast(self, query, headers):
+        lats = [float(v) for v in _listParam(query, "latitude")]
+        lons = [float(v) for v in _listParam(query, "longitude")]
+        zones = _listParam(query, "timezone") or ["GMT"]
+        if len(lats) != len(lons):
+            raise ValueError("latitude and longitude must have the same number of elements")
+        if len(zones) == 1:
+            zones = zones * len(lats)
+        pastDays = int(query.get("past_days", [0])[0])
+        forecastDays = int(query.get("forecast_days", [7])[0])
+        hourly, daily = _listParam(query, "hourly"), _listParam(query, "daily")
+        body = b"".join(
+            forecastMessage(lat, lon, tz, hourly, daily, pastDays, forecastDays, i)
+            for i, (lat, lon, tz) in enumerate(zip(lats, lons, zones))
+        )
+        self._send(200, body, "application/octet-stream", headers)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cities=None, locationsPerCity=5, rateLimit=60, window=60, meteoRateLimit=600,
+                 latencyMs=0, jitterMs=0, errorRate=0.0, seed=0, verbose=False):
+        super().__init__(address, MockHandler)
+        self.locations = buildLocations(cities or loadCities(), locationsPerCity, seed)
+        self.sensors = {
+            sensor["id"]: (location, PARAMETERS[p])
+            for location in self.locations for p, sensor in enumerate(location["sensors"])
+        }
+        self.openaqLimiter = FixedWindowLimiter(rateLimit, window)
+        self.meteoLimiter = FixedWindowLimiter(meteoRateLimit, window)
+        self.latency = latencyMs / 1000
+        self.jitter = jitterMs / 1000
+        self.errorRate = errorRate
+        self.verbose = verbose
+        self.requests = {} # path or outcome -> count, for the summary
+        self._countLock = threading.Lock()
+
+    def count(self, key):
+        key = re.sub(r"/sensors/\d+/", "/sensors/{id}/", key)
+        with self._countLock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start(**kwargs):
+    # MockServer on a background thread (port 0 picks a free port); call .shutdown() when done
+    server = MockServer(("127.0.0.1", kwargs.pop("port", 0)), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAQ v3 / Open-Meteo server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--locations-per-city", type=int, default=5)
+    parser.add_argument("--rate-limit", type=int, default=60, help="OpenAQ requests per window per API key")
+    parser.add_argument("--window", type=int, default=60, help="rate limit window in seconds")
+    parser.add_argument("--meteo-rate-limit", type=int, default=600)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 5xx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = MockServer(
+        (args.host, args.port), locationsPerCity=args.locations_per_city, rateLimit=args.rate_limit, window=args.window,
+        meteoRateLimit=args.meteo_rate_limit, latencyMs=args.latency_ms, jitterMs=args.jitter_ms, errorRate=args.error_rate,
+        seed=args.seed, verbose=args.verbose,
+    )
+    print(f"Mock API on {server.url}: {len(server.locations)} locations, {len(server.sensors)} sensors")
+    print(f"  OPENAQ_BASE_URL={server.url}/v3 OPENMETEO_URL={server.url}/v1/forecast")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Requests: {server.requests}")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Offline pipeline benchmarks: replays the recorded CSVs in data/ (scaled 10x/100x/1000x, see fixtures.py) through
+#   normalize  getHourlyAQData's record -> DataFrame normalization
+#   merge      mergeDataframes (Open-Meteo daily + hourly)
+#   clean      cleaned_data (OpenAQ hours x weather, keys)
+#   copy_csv   the Postgres load path's COPY serialization (iterCsvChunks), no database needed
+# and reports wall time, rows/sec and peak traced memory per stage, then compares against benchmarks/baseline.json.
+#
+#   python -m benchmarks.run                      # scales 10 and 100, fail on regressions
+#   python -m benchmarks.run --scales 10 100 1000
+#   python -m benchmarks.run --update-baseline    # record this machine's numbers as the baseline
+#
+# Exit status 1 when a stage is slower than baseline * (1 + --time-tolerance) or peaks above baseline * (1 + --memory-tolerance).
+# Timings are machine specific, so record the baseline on the machine the comparisons run on.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from pipeline import normalizeHours, mergeDataframes, cleaned_data
+from pipeline.load_postgres import iterCsvChunks
+from . import fixtures
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results.json")
+MIN_SECONDS_DELTA = 0.05 # slowdowns smaller than this are timer noise on the small stages, never a regression
+
+def _measure(fn, prepare, repeat):
+    # (best wall seconds over repeat runs, peak traced MB of one more run, output of the last run).
+    # prepare() builds fresh inputs for each run (the stages modify their inputs in place) and isn't timed
+    best = float("inf")
+    for _ in range(repeat):
+        args = prepare()
+        started = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    args = prepare()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20, out
+
+def _copyCsv(df):
+    # bytes COPY would stream to Postgres
+    return sum(len(buf.getvalue()) for buf in iterCsvChunks(df))
+
+def benchScale(scale, repeat):
+    # {stage: {"rows", "seconds", "rows_per_sec", "peak_mb"}} for one scale
+    rows = fixtures.openAQRows(scale)
+    daily, hourly = fixtures.openMeteoFrames(scale)
+    cities = fixtures.cities(scale)
+    stages = {}
+
+    def record(name, nRows, fn, prepare):
+        seconds, peakMb, out = _measure(fn, prepare, repeat)
+        stages[name] = {"rows": nRows, "seconds": round(seconds, 4), "rows_per_sec": round(nRows / max(seconds, 1e-9)), "peak_mb": round(peakMb, 1)}
+        print(f"  {name:<9} {nRows:>10,} rows  {seconds:8.3f}s  {nRows / max(seconds, 1e-9):>12,.0f} rows/sec  {peakMb:8.1f} MB peak")
+        return out
+
+    openAQ = record("normalize", len(rows), normalizeHours, lambda: (rows,))
+    meteo = record("merge", len(hourly), mergeDataframes, lambda: (daily.copy(), hourly.copy(), cities))
+    cleaned = record("clean", len(openAQ), cleaned_data, lambda: (openAQ.copy(), meteo.copy()))
+    record("copy_csv", len(cleaned), _copyCsv, lambda: (cleaned,))
+    return stages
+
+def compare(results, baseline, timeTolerance, memoryTolerance):
+    # list of regression messages, empty if everything is within tolerance (stages/scales missing from the baseline are skipped)
+    regressions = []
+    for scale, stages in results.items():
+        for stage, now in stages.items():
+            before = baseline.get(scale, {}).get(stage)
+            if before is None:
+                continue
+            if now["seconds"] > before["seconds"] * (1 + timeTolerance) and now["seconds"] - before["seconds"] > MIN_SECONDS_DELTA:
+                regressions.append(f"{scale}x {stage}: {now['seconds']:.3f}s vs baseline {before['seconds']:.3f}s")
+            if now["peak_mb"] > before["peak_mb"] * (1 + memoryTolerance):
+                regressions.append(f"{scale}x {stage}: {now['peak_mb']:.1f} MB vs baseline {before['peak_mb']:.1f} MB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one counts")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.10)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="merge these results into the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale in args.scales:
+        print(f"scale {scale}x")
+        results[str(scale)] = benchScale(scale, args.repeat)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not baseline:
+        print("No baseline yet, run with --update-baseline to record one")
+    elif not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# Cached data access for the dashboard.
+# Streamlit reruns the whole script on every widget interaction, so the Supabase client is a cached resource
+# and every query result is cached (keyed by its parameters) for QUERY_TTL seconds: cache hits make no network calls.
+# Date range and city filters are pushed into the query so only the requested window crosses the wire,
+# and results are paged with range() because PostgREST silently caps a single select at its max-rows limit.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import streamlit as st
+from supabase import create_client
+from dotenv import load_dotenv
+
+load_dotenv()
+QUERY_TTL = int(os.getenv("DASHBOARD_QUERY_TTL", 15 * 60)) # seconds
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", 1000)) # must be <= PostgREST max-rows (1000 on Supabase by default)
+PAGE_WORKERS = 4
+
+@st.cache_resource
+def getClient():
+    # one Supabase client per server process, shared by every session and rerun
+    return create_client(supabase_url=os.getenv("SUPABASE_URL"), supabase_key=os.getenv("SUPABASE_API_KEY"))
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def fetchView(view):
+    # (rows of the view as a DataFrame, unix time it was fetched)
+    response = getClient().table(view).select("*").execute()
+    return pd.DataFrame(response.data), time.time()
+
+def _windowQuery(view, start, end, cities, dateCol, cityCol, count=None):
+    # a fresh builder per request (builders are mutable), filtered server side and in a stable order so pages line up
+    query = getClient().table(view).select("*", count=count)
+    if start is not None:
+        query = query.gte(dateCol, str(start))
+    if end is not None:
+        query = query.lte(dateCol, str(end))
+    if cities is not None:
+        query = query.in_(cityCol, list(cities))
+    return query.order(dateCol).order(cityCol)
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def fetchWindow(view, start=None, end=None, cities=None, dateCol="date", cityCol="city"):
+    # (rows of the view with start <= dateCol <= end and cityCol in cities, unix time it was fetched).
+    # The first page also returns the exact row count, the remaining pages are requested concurrently and stitched back in order
+    first = _windowQuery(view, start, end, cities, dateCol, cityCol, count="exact").range(0, PAGE_SIZE - 1).execute()
+    total = first.count if first.count is not None else len(first.data)
+    offsets = range(PAGE_SIZE, total, PAGE_SIZE)
+
+    def page(offset):
+        return _windowQuery(view, start, end, cities, dateCol, cityCol).range(offset, offset + PAGE_SIZE - 1).execute().data
+
+    rows = list(first.data)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+            for data in pool.map(page, offsets): # map yields in submission order
+                rows.extend(data)
+    return pd.DataFrame(rows), time.time()
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def fetchDateBounds(view, dateCol="date"):
+    # (first date, last date) of a view from two single-row ordered queries, so the date picker never needs the whole history
+    first = getClient().table(view).select(dateCol).order(dateCol).limit(1).execute().data
+    last = getClient().table(view).select(dateCol).order(dateCol, desc=True).limit(1).execute().data
+    if not first:
+        return None, None
+    return pd.to_datetime(first[0][dateCol]).date(), pd.to_datetime(last[0][dateCol]).date()
+
+def clearCache():
+    # "refresh data": drop every cached query so the next call goes back to Supabase
+    fetchView.clear()
+    fetchWindow.clear()
+    fetchDateBounds.clear()
+
+def cacheAge(fetchedAt):
+    # human readable age of a cached result, e.g. "42s" or "3m 5s"
+    seconds = int(time.time() - fetchedAt)
+    return f"{seconds // 60}m {seconds % 60}s" if seconds >= 60 else f"{seconds}s"
@@ -0,0 +1,49 @@
+# Downsampling for the dashboard charts.
+# A chart can't show more distinct points than it has pixels, so series longer than that are reduced with
+# Largest-Triangle-Three-Buckets (LTTB), which keeps the peaks and dips that define the line's shape.
+# Short windows (fewer points than the budget) are passed through untouched, i.e. full resolution when zoomed in.
+
+import numpy as np
+import pandas as pd
+
+CHART_WIDTH_PX = 700 # rendered width of one chart (two per row in the wide layout)
+PX_PER_POINT = 2
+
+def targetPoints(widthPx=CHART_WIDTH_PX, pxPerPoint=PX_PER_POINT):
+    # point budget for a chart widthPx wide
+    return max(int(widthPx // pxPerPoint), 3)
+
+def lttb(x, y, threshold):
+    # indices of the threshold points LTTB keeps out of (x, y); x ascending. First and last points are always kept.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.floor(np.arange(threshold - 1) * every) + 1).astype(int) # bucket i is [edges[i], edges[i+1]), edges[-1] == n-1
+    edges[-1] = n - 1
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nextEnd = edges[i + 2] if i + 2 < len(edges) else n
+        # third vertex: the average of the next bucket (the last point for the last bucket)
+        avgX = x[end:nextEnd].mean()
+        avgY = np.nanmean(y[end:nextEnd]) if np.isfinite(y[end:nextEnd]).any() else y[a]
+        # pick the point of this bucket forming the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - avgX) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avgY - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        keep[i + 1] = a
+    return keep
+
+def downsample(df, xCol, yCol, threshold=None):
+    # df's rows reduced to at most threshold (default: targetPoints()) by LTTB on (xCol, yCol)
+    threshold = targetPoints() if threshold is None else threshold
+    if len(df) <= threshold:
+        return df
+    x = df[xCol]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.astype('int64') # ns since epoch, only the spacing matters
+    return df.iloc[lttb(x.to_numpy(), df[yCol].to_numpy(dtype=float), threshold)]
@@ -7,82 +7,22 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 from datetime import datetime as dt, timedelta as td
-from supabase import create_client
-from dotenv import load_dotenv
 import os 
-
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
-print(SUPABASE_URL)
-print(SUPABASE_API_KEY)
-
-supabase = create_client(supabase_url=SUPABASE_URL, supabase_key=SUPABASE_API_KEY)
-
-# ''' QUERIES: 
-# pm25_daily_city_avg = CREATE VIEW pm25_daily_city_avg AS
-# SELECT 
-#     DATE("datetimeFrom_utc") as date,
-#     sensor_city as city,
-#     AVG(CASE WHEN parameter_name = 'temperature' THEN value END) as avg_temp,
-#     AVG(CASE WHEN parameter_name = 'pm25' THEN value END) as avg_pm25
-# FROM daily_weather
-# WHERE parameter_name IN ('temperature', 'pm25')
-# GROUP BY DATE("datetimeFrom_utc"), sensor_city
-# ORDER BY date, city;
-# --------------------------
-
-# pm25_daily_city_delta = CREATE VIEW pm25_daily_city_delta AS
-# WITH daily_avg AS (
-#     SELECT
-#         sensor_city AS city,
-#         DATE("datetimeFrom_utc") AS day,
-#         AVG(value) AS avg_pm25
-#     FROM daily_weather
-#     WHERE parameter_name = 'pm25'
-#     GROUP BY sensor_city, DATE("datetimeFrom_utc")
-# ),
-# ranked AS (
-#     SELECT
-#         city,
-#         day,
-#         avg_pm25,
-#         ROW_NUMBER() OVER (PARTITION BY city ORDER BY day DESC) AS rn
-#     FROM daily_avg
-# )
-# SELECT
-#     t.city,
-#     t.avg_pm25      AS today,
-#     y.avg_pm25      AS yesterday
-# FROM ranked t
-# LEFT JOIN ranked y
-#     ON t.city = y.city
-#    AND y.rn = 2
-# WHERE t.rn = 1
-# ORDER BY t.city;
-
-# temp_corr = CREATE VIEW temp_corr AS 
-# SELECT 
-#     DATE("datetimeFrom_utc") as date,
-#     sensor_city as city,
-#     AVG(CASE WHEN parameter_name = 'temperature' THEN value END) as avg_temp,
-#     AVG(CASE WHEN parameter_name = 'pm25' THEN value END) as avg_pm25
-# FROM daily_weather
-# WHERE parameter_name IN ('temperature', 'pm25')
-# GROUP BY DATE("datetimeFrom_utc"), sensor_city
-# ORDER BY date, city;
-# '''
-
-# Example: fetch data
-pm25_daily_city_avg = supabase.table("pm25_daily_city_avg").select("*").execute()
-dailyAvg = pd.DataFrame(pm25_daily_city_avg.data)
-
-pm25_daily_city_delta = supabase.table("pm25_daily_city_delta").select("*").execute()
-dailyDelta = pd.DataFrame(pm25_daily_city_delta.data)
-
-tempcorr = supabase.table("temp_corr").select("*").execute()
-tempPm25 = pd.DataFrame(tempcorr.data)
-
+import json
+from downsample import downsample, targetPoints
+from data_access import fetchView, fetchWindow, fetchDateBounds, clearCache, cacheAge, QUERY_TTL
+
+# same city catalog the pipeline ingests from (names, colors, ...), so a new city shows up here without code edits
+CITIES_PATH = os.getenv("ZEPHYR_CITIES", os.path.join(os.path.dirname(__file__), "..", "config", "cities.json"))
+with open(CITIES_PATH) as f:
+    city_catalog = json.load(f)
+
+# KPI sources are rollup tables kept up to date by the load step (pipeline/rollups.py), replacing the old
+# pm25_daily_city_avg / temp_corr / pm25_daily_city_delta views that re-aggregated daily_weather on every read:
+#   daily_city_rollup       date, city, avg_temp, avg_pm25 (one row per city and UTC day)
+#   pm25_city_delta_rollup  city, today, yesterday (latest two days of avg pm25 per city)
+DAILY_ROLLUP = "daily_city_rollup"
+DELTA_ROLLUP = "pm25_city_delta_rollup"
 
 st.set_page_config(
     page_title="Air Quality Dashboard",
@@ -91,9 +31,102 @@ st.set_page_config(
 )
 sidebar = st.sidebar.selectbox('High Level Overview', ('High Level', 'Data Tables'))
 
-tempPm25['date'] = pd.to_datetime(tempPm25['date']).dt.floor("D")
-min_date = tempPm25['date'].min().date()
-max_date = tempPm25['date'].max().date()
+# refresh has to happen before the fetches below so they go back to Supabase on this run
+if st.sidebar.button("Refresh data"):
+    clearCache()
+
+# fetch data (cached, only hits Supabase once per query every QUERY_TTL seconds)
+# the daily views are fetched per date window further down, here only their bounds and the one-row-per-city delta view
+dailyDelta, dailyDelta_fetched = fetchView(DELTA_ROLLUP)
+dailyDelta = dailyDelta.sort_values('city').reset_index(drop=True) if not dailyDelta.empty else dailyDelta
+catalog_cities = tuple(sorted(c['City'] for c in city_catalog))
+min_date, max_date = fetchDateBounds(DAILY_ROLLUP)
+if min_date is None:
+    st.warning("No data available yet.")
+    st.stop()
+
+def loadWindow(view, start, end):
+    # rows of a daily view for the catalog cities between start and end (inclusive), with dates as day timestamps
+    df, fetched = fetchWindow(view, start, end, catalog_cities)
+    df = df.copy() # cached frames are shared between reruns, don't modify them in place
+    if not df.empty:
+        df['date'] = pd.to_datetime(df['date']).dt.floor("D")
+    return df, fetched
+
+FIGURE_CACHE_SIZE = 64 # built chart figures kept per session
+
+def buildCityFigure(city, city_data, pm25_color, temp_color, yaxis_range, temp_range, x_dtick, max_points):
+    # PM2.5 vs temperature chart for one city's rows
+    # each line reduced separately so both keep their own peaks; markers only at full resolution
+    pm25_points = downsample(city_data, 'date', 'avg_pm25', max_points)
+    temp_points = downsample(city_data, 'date', 'avg_temp', max_points)
+    trace_mode = "lines+markers" if len(city_data) <= max_points else "lines"
+
+    fig = go.Figure()
+
+    # PM2.5 line
+    fig.add_trace(
+        go.Scatter(
+            x=pm25_points['date'],
+            y=pm25_points['avg_pm25'],
+            mode=trace_mode,
+            name=f"PM<sub>2.5</sub> (µg/m³)",
+            line=dict(color=pm25_color, width=2),
+            yaxis="y1"
+        )
+    )
+
+    # yaxis_range is None when autoscaling
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='white', dtick=x_dtick, tickformat="%Y-%m-%d", tickangle=-30)
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='white', title_text="PM2.5 (µg/m³)", range=yaxis_range)  # PM2.5 axis
+
+    # Add temperature as a second y-axis by assigning it directly in the trace
+    fig.add_trace(
+        go.Scatter(
+            x=temp_points['date'],
+            y=temp_points['avg_temp'],
+            mode=trace_mode,
+            name="Temperature (°C)",
+            line=dict(color=temp_color, width=2, dash="dot"),
+            yaxis="y2"
+        )
+    )
+
+    # Define the second y-axis in layout
+    fig.update_layout(
+        title=dict(
+            text=f"{city} - PM<sub>2.5</sub> v. Temperature",
+            x=0.5,                # 0 = left, 0.5 = center, 1 = right
+            xanchor='center',
+            yanchor='top',
+            font=dict(
+                size=16,          # increase the font size
+                family="Arial, sans-serif",
+                color="black"
+            )
+        ),
+        plot_bgcolor='#f8f8f8',  # behind the lines / inside the axes
+        paper_bgcolor='#f8f8f8',  # figure background outside the axes
+        xaxis=dict(title="Date"),
+        hovermode="x unified",
+        width=900,   # overall figure width
+        height=500,   # height of the plot
+        yaxis2=dict(
+            title="Temperature (°C)",
+            overlaying="y",
+            side="right",
+            range=temp_range
+        ),
+        legend=dict(
+            x=1.05,        # move it to the right outside the plot
+            y=1,           # top of the plot
+            xanchor='left', 
+            yanchor='top',
+            orientation='v',
+        )
+    )
+    return fig
+
 if 'start_date' not in st.session_state:
     st.session_state.start_date = min_date
 if 'end_date' not in st.session_state:
@@ -310,11 +343,12 @@ if sidebar == "High Level":
             st.session_state.zoom_factor = 20
             # st.session_state.autoscale_toggle = True
 
-    # Apply filtering
-    filtered_tempPm25 = tempPm25[
-        (tempPm25['date'] >= pd.to_datetime(st.session_state.start_date)) &
-        (tempPm25['date'] <= pd.to_datetime(st.session_state.end_date))
-    ]
+    # only the selected window is requested from Supabase
+    filtered_tempPm25, tempPm25_fetched = loadWindow(DAILY_ROLLUP, st.session_state.start_date, st.session_state.end_date)
+    st.sidebar.caption(
+        f"Data age: delta {cacheAge(dailyDelta_fetched)}, temp/PM2.5 {cacheAge(tempPm25_fetched)} "
+        f"(refreshes every {QUERY_TTL // 60} min)"
+    )
 
     # Zoom logic
     if zoom_in:
@@ -323,107 +357,65 @@ if sidebar == "High Level":
         st.session_state.zoom_factor *= 1.2  # expand range (zoom out)
 
 
-    cities = ["Chicago", "Houston", "Los Angeles", "New York"]
-    pm25_colors = {
-        "Chicago": "green",
-        "Houston": "blue",
-        "Los Angeles": "purple",
-        "New York": "orange"
-    }
+    # charts for every catalog city that has data, alphabetically, colored from the catalog
+    cities_with_data = set(filtered_tempPm25['city']) if not filtered_tempPm25.empty else set()
+    cities = sorted(c['City'] for c in city_catalog if c['City'] in cities_with_data)
+    pm25_colors = {c['City']: c.get('Color', 'black') for c in city_catalog}
     temp_color = "red"
+    charts_per_row = 2
+    max_points = targetPoints() # per trace; longer series are LTTB-downsampled to the chart's pixel width
+    # one tick per day only while that stays readable, plotly picks the spacing for longer windows
+    window_days = (pd.to_datetime(st.session_state.end_date) - pd.to_datetime(st.session_state.start_date)).days + 1
+    x_dtick = "D1" if window_days <= 31 else None
 
     # Determine global axis ranges
-    pm25_min = tempPm25['avg_pm25'].min()
-    pm25_max = tempPm25['avg_pm25'].max()
-    temp_min = tempPm25['avg_temp'].min()
-    temp_max = tempPm25['avg_temp'].max()
-
-    # Split cities into 2 rows
-    rows = [cities[:2], cities[2:]]
+    pm25_min = filtered_tempPm25['avg_pm25'].min() if cities_with_data else 0
+    pm25_max = filtered_tempPm25['avg_pm25'].max() if cities_with_data else 0
+    temp_min = filtered_tempPm25['avg_temp'].min() if cities_with_data else 0
+    temp_max = filtered_tempPm25['avg_temp'].max() if cities_with_data else 0
+
+    # per-city normalization in one vectorized pass over the window (no per-city slices being written to)
+    if cities_with_data:
+        by_city = filtered_tempPm25.groupby('city', sort=False)
+        for value, norm in (('avg_pm25', 'pm25_norm'), ('avg_temp', 'temp_norm')):
+            low = by_city[value].transform('min')
+            filtered_tempPm25[norm] = (filtered_tempPm25[value] - low) / (by_city[value].transform('max') - low)
+        city_series = dict(tuple(filtered_tempPm25.groupby('city', sort=False))) # every city's rows in one pass
+
+    # built figures are kept in session_state keyed by everything that shapes them, so a rerun only rebuilds what changed
+    figure_cache = st.session_state.setdefault("figure_cache", {})
+    if autoscale:
+        yaxis_range = None
+    else:
+        yaxis_range = [pm25_min, pm25_max * st.session_state.zoom_factor]
+
+    # Split cities into rows of charts_per_row
+    rows = [cities[i:i + charts_per_row] for i in range(0, len(cities), charts_per_row)]
 
     for row_cities in rows:
-        cols = st.columns(2)  # 2 charts per row
+        cols = st.columns(charts_per_row)  # 2 charts per row
         for col, city in zip(cols, row_cities):
-            city_data = filtered_tempPm25[filtered_tempPm25['city'] == city]
-            city_data['pm25_norm'] = (city_data['avg_pm25'] - city_data['avg_pm25'].min()) / (city_data['avg_pm25'].max() - city_data['avg_pm25'].min())
-            city_data['temp_norm'] = (city_data['avg_temp'] - city_data['avg_temp'].min()) / (city_data['avg_temp'].max() - city_data['avg_temp'].min())
-
-            fig = go.Figure()
-
-            # PM2.5 line
-            fig.add_trace(
-                go.Scatter(
-                    x=city_data['date'],
-                    y=city_data['avg_pm25'],
-                    mode="lines+markers",
-                    name=f"PM<sub>2.5</sub> (µg/m³)",
-                    line=dict(color=pm25_colors.get(city, "black"), width=2),
-                    yaxis="y1"
+            fig_key = (city, st.session_state.start_date, st.session_state.end_date, st.session_state.zoom_factor, autoscale, tempPm25_fetched)
+            fig = figure_cache.get(fig_key)
+            if fig is None:
+                fig = buildCityFigure(
+                    city, city_series[city], pm25_colors.get(city, "black"), temp_color,
+                    yaxis_range, [temp_min, temp_max], x_dtick, max_points,
                 )
-            )
-
-            # --- Apply global autoscale ---
-            if autoscale:
-                yaxis_range = None
-            else:
-                base_max = pm25_max  # or whatever your normal max is
-                base_min = pm25_min  # optional
-                yaxis_range = [base_min, base_max * st.session_state.zoom_factor]
-            # yaxis_range = None if autoscale else [pm25_min, pm25_max]
-            fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='white', dtick="D1", tickformat="%Y-%m-%d", tickangle=-30)
-            fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='white', title_text="PM2.5 (µg/m³)", range=yaxis_range)  # PM2.5 axis
-
-            # Add temperature as a second y-axis by assigning it directly in the trace
-            fig.add_trace(
-                go.Scatter(
-                    x=city_data['date'],
-                    y=city_data['avg_temp'],
-                    mode="lines+markers",
-                    name="Temperature (°C)",
-                    line=dict(color=temp_color, width=2, dash="dot"),
-                    yaxis="y2"
-                )
-            )
-
-            # Define the second y-axis in layout
-            fig.update_layout(
-                title=dict(
-                    text=f"{city} - PM<sub>2.5</sub> v. Temperature",
-                    x=0.5,                # 0 = left, 0.5 = center, 1 = right
-                    xanchor='center',
-                    yanchor='top',
-                    font=dict(
-                        size=16,          # increase the font size
-                        family="Arial, sans-serif",
-                        color="black"
-                    )
-                ),
-                plot_bgcolor='#f8f8f8',  # behind the lines / inside the axes
-                paper_bgcolor='#f8f8f8',  # figure background outside the axes
-                xaxis=dict(title="Date"),
-                hovermode="x unified",
-                width=900,   # overall figure width
-                height=500,   # height of the plot
-                yaxis2=dict(
-                    title="Temperature (°C)",
-                    overlaying="y",
-                    side="right",
-                    range=[temp_min, temp_max]
-                ),
-                legend=dict(
-                    x=1.05,        # move it to the right outside the plot
-                    y=1,           # top of the plot
-                    xanchor='left', 
-                    yanchor='top',
-                    orientation='v',
-                )
-            )
+                figure_cache[fig_key] = fig
+                while len(figure_cache) > FIGURE_CACHE_SIZE:
+                    figure_cache.pop(next(iter(figure_cache))) # oldest first
 
             # Place chart in the column
             col.plotly_chart(fig, use_container_width=True, key=f"{city}_chart")
 
 
 if sidebar == 'Data Tables':
+    # daily averages and temperature/PM2.5 now come from the same rollup table
+    dailyAvg, dailyAvg_fetched = loadWindow(DAILY_ROLLUP, st.session_state.start_date, st.session_state.end_date)
+    st.sidebar.caption(
+        f"Data age: daily {cacheAge(dailyAvg_fetched)}, delta {cacheAge(dailyDelta_fetched)} "
+        f"(refreshes every {QUERY_TTL // 60} min)"
+    )
     st.write(dailyAvg)
-    st.write(dailyDelta)
-    st.write(tempPm25)
\ No newline at end of file
+    st.write(dailyDelta)
\ No newline at end of file
@@ -1,14 +1,69 @@
-from pipeline import getOpenAQSensors, getHourlyAQData, getOpenMeteoData, mergeDataframes, cleaned_data
+import pandas as pd
+from pipeline import getOpenAQSensors, getHourlyAQData, getOpenMeteoData, mergeDataframes, cleaned_data, collectWatermarks, loadCities
+from pipeline import writeHourlyAQ, writeDataset, OPENMETEO_HOURS, CLEANED, loadWatermarks, DAG, metrics, getLogger
 
-def main():
+log = getLogger("ingestion")
+
+def _writeRaw(openAQ, meteo):
+    _, hourly, _ = meteo
+    if openAQ.empty or hourly.empty:
+        return False # nothing gets loaded this run, the same hours come back next run
+    unfinished = openAQ.attrs.get("unfinished_sensors", [])
+    writeHourlyAQ(openAQ[~openAQ['Sensor ID'].isin(unfinished)]) # unfinished sensors are written whole by the run that finishes them
+    writeDataset(hourly, OPENMETEO_HOURS, 'City', 'date')
+    return True # checkpointed, so a rerun of the same batch doesn't append the raw hours twice
+
+def _merge(meteo):
+    daily, hourly, cities = meteo
+    if hourly.empty:
+        return pd.DataFrame()
+    return mergeDataframes(daily.copy(), hourly.copy(), cities) # mergeDataframes floors/adds columns in place, and meteo is shared with writeRaw
+
+def _clean(openAQ, merged):
+    if openAQ.empty or merged.empty:
+        return pd.DataFrame()
+    return cleaned_data(openAQ.copy(), merged) # cleaned_data renames columns in place, and openAQ is shared with other stages
+
+def _writeCleaned(cleaned):
+    writeDataset(cleaned, CLEANED, 'sensor_city', 'hourly_datetime_utc')
+    return True
+
+def main(fullRefresh=False, writeLake=True, resume=False):
     # it's later now. Callinga ll of those imported functions
-    sensorList = getOpenAQSensors()
-    openAQ = getHourlyAQData(sensorList)
-    daily, hourly, cities = getOpenMeteoData()
-    meteo = mergeDataframes(daily, hourly, cities)
-    dailyWeather = cleaned_data(openAQ, meteo)
-    return dailyWeather
+    # only hours after each sensor/city watermark are fetched unless fullRefresh=True.
+    # raw OpenAQ hours, raw Open-Meteo hours and the cleaned batch are also appended to the Parquet lake (data/lake) unless writeLake=False.
+    # stages run as a DAG: the OpenAQ and Open-Meteo branches run concurrently, and every stage's output is checkpointed (.state/checkpoints)
+    # so a rerun after a failure picks up where it stopped. Fetches are keyed on the watermarks and the current UTC hour,
+    # so once a batch is loaded (watermarks move) or an hour has passed, they go back to the APIs.
+    # resume=True continues an interrupted OpenAQ fetch from its recorded page progress instead of refetching every sensor.
+    # a fetch with unfinished sensors isn't checkpointed, so the resumed run really goes back to the API for them.
+    # returns the cleaned batch, the watermarks to save once it's loaded, and the sensors that didn't finish (keep their progress)
+    fetchKey = {"fullRefresh": fullRefresh, "watermarks": loadWatermarks(), "hour": pd.Timestamp.now(tz='UTC').floor('h')}
+    dag = DAG()
+    dag.add("cities", loadCities, checkpoint=False) # config/cities.json
+    dag.add("sensors", lambda cities: getOpenAQSensors(cities), deps=["cities"], key=fetchKey["hour"])
+    # sensors fetched in parallel under the shared rate limiter
+    dag.add("openAQ", lambda sensors: getHourlyAQData(sensors, concurrent=True, fullRefresh=fullRefresh, resume=resume), deps=["sensors"], key=fetchKey,
+            checkpoint=lambda openAQ: not openAQ.attrs.get("unfinished_sensors"))
+    # weather starts at each city's furthest-behind sensor, so it waits for the (registry lookup) sensors stage
+    dag.add("meteo", lambda cities, sensors: getOpenMeteoData(fullRefresh=fullRefresh, cities=cities, sensors=sensors), deps=["cities", "sensors"], key=fetchKey)
+    if writeLake:
+        dag.add("writeRaw", _writeRaw, deps=["openAQ", "meteo"])
+    dag.add("merged", _merge, deps=["meteo"])
+    dag.add("cleaned", _clean, deps=["openAQ", "merged"])
+    if writeLake:
+        dag.add("writeCleaned", _writeCleaned, deps=["cleaned"])
+    results = dag.run()
+
+    openAQ, dailyWeather = results["openAQ"], results["cleaned"]
+    unfinished = openAQ.attrs.get("unfinished_sensors", [])
+    if dailyWeather.empty:
+        log.info("No new hours since the last load")
+        return pd.DataFrame(), {}, unfinished
+    marks = collectWatermarks(openAQ, dailyWeather, skipSensors=unfinished)
+    return dailyWeather, marks, unfinished
 
 if __name__ == "__main__":
-    df = main()
-    print(df.head())  # optional: just to confirm it runs standalone (sanity check #???)
\ No newline at end of file
+    df, marks, unfinished = main()
+    log.info("Cleaned batch:\n%s", df.head())  # optional: just to confirm it runs standalone (sanity check #???)
+    metrics.emit()
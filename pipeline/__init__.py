@@ -1,3 +1,13 @@
-from .ingestion_openaq import getOpenAQSensors, getHourlyAQData
+from .ingestion_openaq import getOpenAQSensors, refreshSensorRegistry, getHourlyAQData, normalizeHours, iterHourlyAQPages, writeHourlyAQPartitions, writeHourlyAQ
 from .ingestion_openmeteo import getOpenMeteoData, mergeDataframes
-from .ingestion_cleaned import cleaned_data
\ No newline at end of file
+from .ingestion_cleaned import cleaned_data, cleaned_partitions
+from .watermarks import loadWatermarks, saveWatermarks, collectWatermarks
+from .load_postgres import ensureTable, upsertDataframe, copyDataframe
+from .lake import writeDataset, readDataset, listPartitions, OPENAQ_HOURS, OPENMETEO_HOURS, CLEANED
+from .sensor_registry import loadRegistry, SensorIndex
+from .catalog import loadCities
+from .rollups import ensureRollups, refreshRollups, rebuildRollups
+from .dag import DAG
+from .progress import PageProgress, clearProgress
+from .metrics import metrics, getLogger
+from .schema import compactFrame
@@ -0,0 +1,20 @@
+# The city catalog (config/cities.json, or wherever ZEPHYR_CITIES points): one entry per metro area with
+# City, Latitude, Longitude, Timezone, Radius (km), Tags and Color. Ingestion and the dashboard both read it,
+# so adding a city is a config edit.
+
+import json
+import os
+
+CITIES_PATH = os.getenv("ZEPHYR_CITIES", os.path.join(os.path.dirname(__file__), "..", "config", "cities.json"))
+DEFAULT_RADIUS_KM = 5
+
+def loadCities(path=CITIES_PATH, tags=None):
+    # catalog entries, optionally only those carrying at least one of tags
+    with open(path) as f:
+        cities = json.load(f)
+    for info in cities:
+        info.setdefault("Radius (km)", DEFAULT_RADIUS_KM)
+        info.setdefault("Tags", [])
+    if tags:
+        cities = [info for info in cities if set(tags) & set(info["Tags"])]
+    return cities
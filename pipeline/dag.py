@@ -0,0 +1,130 @@
+# Small DAG runner for the ingestion stages.
+# Stages declare the stages they depend on and get those results as keyword arguments; every stage whose dependencies are
+# done is started on a thread pool, so independent branches (OpenAQ vs Open-Meteo) overlap and a run takes max(branch), not sum(stages).
+# Each checkpointed stage's output is pickled under CHECKPOINT_DIR, named by a fingerprint of the stage name, its key and its
+# dependencies' fingerprints. A rerun with the same inputs loads the checkpoint instead of running the stage,
+# so a failure late in the run doesn't mean fetching everything again.
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .metrics import metrics, getLogger
+
+log = getLogger("dag")
+
+CHECKPOINT_DIR = os.getenv("ZEPHYR_CHECKPOINTS", ".state/checkpoints")
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600 # seconds; older checkpoint files are pruned at the start of a run
+
+class Stage:
+    def __init__(self, name, fn, deps=(), key=None, checkpoint=True):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.key = key # anything JSON-able the output depends on besides the deps (flags, watermarks, ...)
+        self.checkpoint = checkpoint # True/False, or a function of the result deciding whether this run's result is saved
+
+class DAG:
+    def __init__(self, checkpointDir=CHECKPOINT_DIR, maxWorkers=4):
+        self.stages = {}
+        self.checkpointDir = checkpointDir
+        self.maxWorkers = maxWorkers
+
+    def add(self, name, fn, deps=(), key=None, checkpoint=True):
+        # register a stage; deps must already be registered, which also rules out cycles
+        missing = [d for d in deps if d not in self.stages]
+        if name in self.stages or missing:
+            raise ValueError(f"stage {name!r}: duplicate name or unknown deps {missing}")
+        self.stages[name] = Stage(name, fn, deps, key, checkpoint)
+        return self
+
+    def _fingerprint(self, stage, fingerprints, result=None, hashResult=False):
+        # checkpointed stages: name + key + deps' fingerprints. Uncheckpointed (cheap) stages always run, their output is the fingerprint
+        h = hashlib.sha256(stage.name.encode())
+        h.update(json.dumps(stage.key, sort_keys=True, default=str).encode())
+        for dep in stage.deps:
+            h.update(fingerprints[dep].encode())
+        if hashResult:
+            h.update(pickle.dumps(result))
+        return h.hexdigest()[:16]
+
+    @staticmethod
+    def _rows(value):
+        # rows in a stage result: DataFrames count, tuples/lists of them are summed, anything else is None
+        if hasattr(value, "shape") and hasattr(value, "columns"):
+            return len(value)
+        if isinstance(value, (tuple, list)):
+            counts = [DAG._rows(v) for v in value]
+            counts = [c for c in counts if c is not None]
+            return sum(counts) if counts else None
+        return None
+
+    def _path(self, stage, fingerprint):
+        return os.path.join(self.checkpointDir, f"{stage.name}-{fingerprint}.pkl")
+
+    def _prune(self):
+        if not os.path.isdir(self.checkpointDir):
+            return
+        cutoff = time.time() - CHECKPOINT_MAX_AGE
+        for name in os.listdir(self.checkpointDir):
+            path = os.path.join(self.checkpointDir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def _runStage(self, stage, results, fingerprints):
+        # returns (result, fingerprint, seconds, loaded from checkpoint?)
+        started = time.perf_counter()
+        kwargs = {dep: results[dep] for dep in stage.deps}
+        if not stage.checkpoint:
+            result = stage.fn(**kwargs)
+            return result, self._fingerprint(stage, fingerprints, result, hashResult=True), time.perf_counter() - started, False
+        fingerprint = self._fingerprint(stage, fingerprints)
+        path = self._path(stage, fingerprint)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return pickle.load(f), fingerprint, time.perf_counter() - started, True
+        result = stage.fn(**kwargs)
+        if callable(stage.checkpoint) and not stage.checkpoint(result):
+            # not saved (e.g. a partial fetch the next run should redo), so stages downstream are keyed on its contents instead
+            return result, self._fingerprint(stage, fingerprints, result, hashResult=True), time.perf_counter() - started, False
+        os.makedirs(self.checkpointDir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path) # a crash mid-write never leaves a truncated checkpoint behind
+        return result, fingerprint, time.perf_counter() - started, False
+
+    def run(self):
+        # runs every stage, returns {stage name: result}. The first failure stops scheduling and is re-raised;
+        # stages that already finished keep their checkpoints for the next run
+        self._prune()
+        results, fingerprints = {}, {}
+        pending = dict(self.stages)
+        running = {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.deps):
+                        running[pool.submit(self._runStage, stage, results, fingerprints)] = stage
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result, fingerprint, seconds, cached = future.result()
+                    except Exception:
+                        log.error("Stage %s failed", stage.name)
+                        for other in running:
+                            other.cancel()
+                        raise
+                    results[stage.name] = result
+                    fingerprints[stage.name] = fingerprint
+                    rowsIn = self._rows([results[dep] for dep in stage.deps])
+                    metrics.recordStage(stage.name, seconds=seconds, rowsIn=rowsIn, rowsOut=self._rows(result), cached=int(cached))
+                    log.info("Stage %s: %s in %.2fs", stage.name, 'checkpoint' if cached else 'ran', seconds)
+        log.info("DAG finished in %.2fs", time.perf_counter() - started)
+        return results
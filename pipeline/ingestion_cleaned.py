@@ -1,5 +1,8 @@
 import pandas as pd
-import hashlib
+from .lake import iterPartitions, OPENAQ_HOURS, LAKE_ROOT
+from .timeutils import toUtc, OPENAQ_UTC_FORMAT
+from .keys import rowKeys, checkCollisions
+from .schema import compactFrame, alignCategories
 
 def cleaned_data(openAQ, meteo):
     openAQ.columns = openAQ.columns.str.replace('.', '_')
@@ -16,12 +19,16 @@ def cleaned_data(openAQ, meteo):
         'City':'sensor_city',
 
     }, inplace=True)
+    compactFrame(openAQ) # no-op for frames straight from normalizeHours/mergeDataframes, converts lake or CSV input
+    compactFrame(meteo)
 
-    meteo['hourly_datetime_utc'] = pd.to_datetime(meteo['hourly_datetime (UTC)'], utc=True, errors='coerce')
-    openAQ['datetimeFrom_utc'] = pd.to_datetime(openAQ['datetimeFrom_utc'], utc=True, errors='coerce')
-    openAQ['datetimeTo_utc'] = pd.to_datetime(openAQ['datetimeTo_utc'], utc=True, errors='coerce')
+    # every time column parsed exactly once (mergeDataframes already hands over real datetimes, those are only converted)
+    meteo['hourly_datetime_utc'] = toUtc(meteo['hourly_datetime (UTC)'])
+    openAQ['datetimeFrom_utc'] = toUtc(openAQ['datetimeFrom_utc'], OPENAQ_UTC_FORMAT)
+    openAQ['datetimeTo_utc'] = toUtc(openAQ['datetimeTo_utc'], OPENAQ_UTC_FORMAT)
     
-    openAQ_hourly = openAQ.groupby(['parameter_name','datetimeFrom_utc', 'sensor_city']).agg({
+    # observed=True: with categorical keys, only the combinations that occur (not every parameter x hour x city)
+    openAQ_hourly = openAQ.groupby(['parameter_name','datetimeFrom_utc', 'sensor_city'], observed=True).agg({
         'datetimeTo_utc': 'last',
         'sensor_id': 'first',
         'sensor_station_name': 'first',
@@ -32,12 +39,25 @@ def cleaned_data(openAQ, meteo):
         'value': 'mean',
     }).reset_index()
 
-    cleaned = pd.merge(meteo, openAQ_hourly, how='inner', left_on='hourly_datetime_utc', right_on='datetimeFrom_utc')
+    # matching weather to air quality on hour AND city, otherwise every city's weather gets paired with every other city's sensors
+    alignCategories(meteo, 'City', openAQ_hourly, 'sensor_city')
+    cleaned = pd.merge(meteo, openAQ_hourly, how='inner', left_on=['hourly_datetime_utc', 'City'], right_on=['datetimeFrom_utc', 'sensor_city'])
 
-    cleaned["row_id"] = cleaned.index
-    cleaned['gen_timestamp'] = pd.Timestamp.now() # creating generated timestamp for unique key creation
-    cleaned['composite_key'] = cleaned['row_id'].astype(str) + cleaned['sensor_city'].astype(str) + cleaned['parameter_name'].astype(str) + cleaned['hourly_datetime (UTC)'].astype(str) # rather than lambda which slows down as datasets get larger
-    cleaned['unique_id'] = [hashlib.sha256(x.encode()).hexdigest()[:12] for x in cleaned['composite_key']] # created sha256 (shortened to 12char)
-    cleaned = cleaned.drop(columns=['hourly_datetime (UTC)', 'City', 'composite_key', 'row_id'])
+    cleaned['gen_timestamp'] = pd.Timestamp.now() # load timestamp, not part of the key
+    # key only uses what identifies the observation (city + parameter + hour), so reruns produce the same unique_id and the load can upsert on it
+    cleaned['unique_id'] = rowKeys(cleaned) # vectorized 64-bit hash, rather than sha256 per row in a list comprehension
+    checkCollisions(cleaned, cleaned['unique_id'])
+    cleaned = cleaned.drop(columns=['hourly_datetime (UTC)', 'City'])
     cleaned = cleaned[sorted(cleaned.columns)]
-    return cleaned
\ No newline at end of file
+    return cleaned
+
+def cleaned_partitions(meteo, root=LAKE_ROOT):
+    # runs cleaned_data one city/day partition of the lake's openaq_hours at a time (as written by writeHourlyAQPartitions), yielding each cleaned chunk.
+    # groups in cleaned_data never span cities or days, so the chunks add up to the same result as one big call
+    for values, openAQ in iterPartitions(OPENAQ_HOURS, root=root):
+        cityMeteo = meteo[meteo['City'] == values['city']].copy()
+        if cityMeteo.empty:
+            continue
+        cleaned = cleaned_data(openAQ.drop(columns=['city', 'day']), cityMeteo)
+        if not cleaned.empty:
+            yield cleaned
@@ -3,14 +3,86 @@
 
 import pandas as pd
 import requests
+import requests_cache
+import threading
+from collections import Counter
 from datetime import datetime as dt, timedelta as td, timezone as tz
-import time
 import os 
-BASE = 'https://api.openaq.org/v3'
+import itertools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .ratelimit import RateLimiter
+from .watermarks import loadWatermarks, getWatermark
+from .lake import writeDataset, OPENAQ_HOURS, LAKE_ROOT
+from .timeutils import toUtc, OPENAQ_UTC_FORMAT
+from .catalog import loadCities
+from .sensor_registry import loadRegistry, saveRegistry, mergeRegistry, isStale, SensorIndex
+from .progress import PageProgress
+from .schema import compactFrame
+from .metrics import metrics, getLogger
+BASE = os.getenv("OPENAQ_BASE_URL", 'https://api.openaq.org/v3') # point at benchmarks/mock_api.py for offline/load testing
 
 from dotenv import load_dotenv # loading api key from .env file
 load_dotenv()
 XAPIKEY = os.getenv("APIKEY") # storing apikey
+log = getLogger("openaq")
+limiter = RateLimiter() # one bucket shared by every OpenAQ call so threads can't overrun the quota together
+
+# on-disk response cache so reruns and crash recovery don't spend rate-limit budget on pages we already have.
+# expired entries with an ETag/Last-Modified get revalidated with a conditional request instead of a full download
+LOCATIONS_TTL = 60 * 60 # /locations changes as sensors come and go, keep it short
+HOURS_TTL = 30 * 24 * 60 * 60 # hour windows that closed long ago don't change
+OPEN_WINDOW_TTL = 10 * 60 # recent hour windows, where late or corrected OpenAQ data still shows up
+CLOSED_WINDOW_AGE = pd.Timedelta(hours=48) # a window ending longer ago than this gets HOURS_TTL
+RETRY_BACKOFF = 1.0 # seconds before the first retry of a 5xx or connection error, doubling each attempt
+RETRY_BACKOFF_MAX = 30.0
+session = requests_cache.CachedSession('.cache_openaq', backend='sqlite', expire_after=LOCATIONS_TTL)
+cacheStats = Counter() # hits / misses / revalidated, reported at the end of a run
+_cacheLock = threading.Lock()
+
+def _countCache(outcome):
+    with _cacheLock:
+        cacheStats[outcome] += 1
+
+def _endpoint(url):
+    # metrics label for a request: the path with ids templated out, e.g. /sensors/{id}/hours
+    return re.sub(r'/\d+', '/{id}', url[len(BASE):] if url.startswith(BASE) else url)
+
+def _get(url, headers, params, ttl=LOCATIONS_TTL, maxRetries=5, refresh=False):
+    # every OpenAQ request goes through here: fresh cache hits return straight away without using a token,
+    # otherwise wait for a token, call, learn the quota from the headers, retry on 429 (the limiter does the waiting)
+    # and on 5xx / connection errors (exponential backoff). Only the last attempt's error reaches the caller.
+    # refresh=True (full refresh) skips the cache and overwrites the cached copy with what the API says now
+    endpoint = _endpoint(url)
+    cached = None if refresh else session.get(url, headers=headers, params=params, only_if_cached=True) # 504 if there's no fresh copy
+    if cached is not None and cached.status_code != 504:
+        _countCache('hits')
+        metrics.recordCall(endpoint, cached=True)
+        return cached
+    for attempt in range(maxRetries + 1):
+        limiter.acquire()
+        backoff = min(RETRY_BACKOFF * 2 ** attempt, RETRY_BACKOFF_MAX)
+        try:
+            response = session.get(url, headers=headers, params=params, expire_after=ttl, force_refresh=refresh)
+        except requests.exceptions.RequestException as reqErr:
+            metrics.recordCall(endpoint, status=599) # no response at all, counted as an error
+            if attempt == maxRetries:
+                raise
+            log.warning("%s from %s, retrying in %.0fs (attempt %d of %d)", type(reqErr).__name__, url, backoff, attempt + 1, maxRetries)
+            time.sleep(backoff)
+            continue
+        limiter.update(response)
+        metrics.recordCall(endpoint, len(response.content), response.status_code)
+        if response.status_code == 429 and attempt < maxRetries:
+            log.warning("429 from %s, backing off (attempt %d of %d)", url, attempt + 1, maxRetries)
+        elif response.status_code >= 500 and attempt < maxRetries:
+            log.warning("%d from %s, retrying in %.0fs (attempt %d of %d)", response.status_code, url, backoff, attempt + 1, maxRetries)
+            time.sleep(backoff)
+        else:
+            break
+    _countCache('revalidated' if getattr(response, 'revalidated', False) else 'misses')
+    return response
 
 def timestamps(d):
     today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -19,158 +91,285 @@ def timestamps(d):
     # print(delta, yesterday)
     return delta, yesterday
 
-def getOpenAQSensors():
-    cities = [
-        {"City": "Los Angeles", "Latitude": 34.0522, "Longitude": -118.2437, "Timezone": "America/Los_Angeles"},
-        {"City": "New York", "Latitude": 40.7128, "Longitude": -74.0060, "Timezone": "America/New_York"},
-        {"City": "Chicago", "Latitude": 41.8781, "Longitude": -87.6298, "Timezone": "America/Chicago"},
-        {"City": "Houston", "Latitude": 29.7604, "Longitude": -95.3698, "Timezone": "America/Chicago"},
-    ]
-    # lists for appending data 
-    id = [] # sensor IDs
-    first = [] # first seen
-    last = [] # last seen
-    latitude = []
-    longitude = []
-    name = [] # name of sensor
-    city = [] # city name list
-    timezone = [] # timezone of sensor
-
-    url = f'{BASE}/locations'  
-    headers = {
-        "X-API-Key": XAPIKEY,
-        'Content-Type': 'application/json'
-    }
-    for info in cities:
-        c = info['City']
-        lat = info['Latitude']
-        long = info['Longitude']
-        tzone = info['Timezone']
-        coordinates = str(lat) + ","+ str(long)
-        print(c, " ", coordinates)
+def refreshSensorRegistry(countries_id=155, pageLimit=1000):
+    # pages through every /locations entry for the country (a handful of calls at 1000 per page)
+    # and merges it into the local sensor registry, so city/radius lookups afterwards cost no API calls.
+    # a refresh that fails part way saves nothing: a partial registry stamped as refreshed would pass isStale for a day
+    url = f'{BASE}/locations'
+    headers = _headers()
+    rows = []
+    page = 1
+    failed = False
+    while True:
         params = {
-            "coordinates": coordinates, # LA
-            "radius": 5000,  # in meters (5km search radius)
-            "limit": 100, # page size
-            "countries_id":155, # USA
-            "sort": "desc" # ordering by ID desc
+            "countries_id": countries_id, # USA
+            "limit": pageLimit, # page size
+            "page": page,
         }
-        try: 
-            response = requests.get(url, headers=headers, params=params) # get request to OpenAQ
-            r = response.json() # returning as parseable json
-            # pp.pprint(r)
-
-            for results in r['results']:
-                sensors = results['sensors']
-                for sensor in sensors:
-                    id.append(sensor.get('id', ''))
-                    latitude.append((results.get('coordinates') or {}).get('latitude', ''))
-                    longitude.append((results.get('coordinates') or {}).get('longitude', ''))
-                    first.append((results.get('datetimeFirst') or {}).get('utc', ''))
-                    last.append((results.get('datetimeLast') or {}).get('utc', ''))
-                    name.append(results.get('name', ''))
-                    timezone.append(results.get('timezone', ''))
-                    city.append(c) # adding city name for clarification
-
-            # appending to dataframe
-            df = pd.DataFrame({
-                'Sensor ID': id,
-                'Latitude': latitude,
-                'Longitude': longitude,
-                'City': city,
-                'Station Name': name,
-                'First Seen (UTC)': first,
-                'Last Seen (UTC)': last,
-                'Timezone': timezone,
-            })
-            today_utc = pd.Timestamp(dt.now(tz.utc))
-            yesterday = today_utc - pd.Timedelta(days=1)
-            week_ago = yesterday - pd.Timedelta(days=7) # getting time delta as of yesterday - 7d ago
-            # sanity check
-            print(yesterday)
-            print(week_ago)
-            df['Last Seen (UTC)'] = pd.to_datetime(df['Last Seen (UTC)'], utc=True, errors='coerce')
-            df1 = df[(df['Last Seen (UTC)'] >= yesterday) & (df['Last Seen (UTC)'] <= today_utc)] # getting specifically sensors only found in the past day
+        try:
+            response = _get(url, headers, params) # get request to OpenAQ
+            results = response.json()['results'] # returning as parseable json
         except requests.exceptions.RequestException as reqErr:
-            print(f'Request error occurred: {reqErr}')
+            log.warning('Request error occurred: %s', reqErr)
+            failed = True
+            break
         except ValueError as jsonErr:
-            print(f'Request error occurred: {jsonErr}')
+            log.warning('Request error occurred: %s', jsonErr)
+            failed = True
+            break
         except KeyError as keyErr:
-            print(f'Request error occurred: {keyErr}')
+            log.warning('Request error occurred: %s', keyErr)
+            failed = True
+            break
+        if not results:
+            break
+        for location in results:
+            coordinates = location.get('coordinates') or {}
+            for sensor in location.get('sensors', []):
+                rows.append({
+                    'Sensor ID': sensor.get('id'),
+                    'Location ID': location.get('id'),
+                    'Station Name': location.get('name', ''),
+                    'Latitude': coordinates.get('latitude'),
+                    'Longitude': coordinates.get('longitude'),
+                    'Timezone': location.get('timezone', ''),
+                    'Parameter': (sensor.get('parameter') or {}).get('name', ''),
+                    'First Seen (UTC)': (location.get('datetimeFirst') or {}).get('utc'),
+                    'Last Seen (UTC)': (location.get('datetimeLast') or {}).get('utc'),
+                })
+        log.info("Registry refresh: page %d, %d sensors so far", page, len(rows))
+        page += 1
+
+    registry = loadRegistry()
+    if failed:
+        log.warning("Registry refresh stopped at page %d, keeping the saved registry (%d sensors)", page, len(registry))
+        return registry
+    if rows:
+        registry = mergeRegistry(registry, pd.DataFrame(rows)) # DataFrame built once, not on every loop
+        saveRegistry(registry)
+    return registry
+
+def getOpenAQSensors(cities=None, radiusKm=None, refresh=False, maxAgeHours=24):
+    # sensors within each city's catalog radius (or radiusKm for all) of its centre that reported in the past day, looked up in the local registry.
+    # the registry is only refreshed from the API when it's older than maxAgeHours (or refresh=True),
+    # so adding a city or widening the radius costs no API calls
+    cities = cities or loadCities()
+    registry = loadRegistry()
+    if refresh or isStale(registry, maxAgeHours):
+        registry = refreshSensorRegistry()
+    outCols = ['Sensor ID', 'Latitude', 'Longitude', 'City', 'Station Name', 'First Seen (UTC)', 'Last Seen (UTC)', 'Timezone']
+    if registry.empty:
+        # nothing to look sensors up in (a first run whose refresh failed): fail the run rather than load nothing and exit cleanly
+        raise RuntimeError("sensor registry is empty, the /locations refresh didn't complete; rerun once the OpenAQ API is reachable")
+    index = SensorIndex(registry)
+
+    today_utc = pd.Timestamp(dt.now(tz.utc))
+    yesterday = today_utc - pd.Timedelta(days=1)
+    frames = []
+    for info in cities:
+        radius = radiusKm or info['Radius (km)']
+        near = index.query(info['Latitude'], info['Longitude'], radius, activeSince=yesterday) # getting specifically sensors only found in the past day
+        near = near[near['Last Seen (UTC)'] <= today_utc]
+        log.info("%s: %d active sensors within %s km", info['City'], len(near), radius)
+        frames.append(near.assign(City=info['City'])) # adding city name for clarification
+
+    df = pd.concat(frames, ignore_index=True)
+    df['First Seen (UTC)'] = df['First Seen (UTC)'].dt.strftime('%Y-%m-%dT%H:%M:%SZ') # same shape the /locations call used to hand back
+    return df[outCols]
+
+def _resumePoint(status, params):
+    # where a resumed sensor picks up: (params to fetch with, pages to replay from the spool, whether its window is complete).
+    # a recorded window starting no later than this run's still covers it, so its datetime_from is kept and its pages reused;
+    # if datetime_to has moved on (a new day) the last recorded page is fetched again, it may now hold more hours (pages are in time order)
+    if status["from"] is None or pd.Timestamp(status["from"], tz='UTC') > pd.Timestamp(params['datetime_from'], tz='UTC'):
+        return params, 0, False # nothing recorded, or a window that starts later than this run needs: start over
+    params = {**params, 'datetime_from': status["from"]}
+    if status["to"] == str(params['datetime_to']):
+        return params, status["page"], status["done"]
+    return params, max(status["page"] - 1, 0), False
+
+def _iterSensorPages(sensor_id, params, headers, counter, progress=None, resume=False, refresh=False):
+    # yields the results list of each /sensors/{id}/hours page in page order, so every caller (serial or threaded) sees the same rows.
+    # with a PageProgress every landed page is recorded; resume=True replays the sensor's completed pages from disk
+    # and only calls the API from the first page that didn't complete (nothing at all if the window was finished)
+    page = 1
+    ttl = HOURS_TTL if pd.Timestamp(params['datetime_to']) < pd.Timestamp(dt.now()) - CLOSED_WINDOW_AGE else OPEN_WINDOW_TTL
+    key = PageProgress.sensorKey(sensor_id)
+    if progress is not None:
+        replay, done = 0, False
+        if resume:
+            params, replay, done = _resumePoint(progress.status(key), params)
+            if replay:
+                log.info("Resuming sensor %s: %d pages from disk%s", sensor_id, replay, ', window complete' if done else '')
+            yield from progress.loadPages(key, replay)
+            if done:
+                return
+            page = replay + 1
+        progress.reset(key, PageProgress.window(params), replay)
+    while True:
+        callNumber = next(counter) # shared itertools.count, safe to bump from several threads
+        pageParams = {**params, 'page': page} # own copy per call since threads share the base params
+        url = f'{BASE}/sensors/{sensor_id}/hours'
+        log.debug("CALL # %d ----- ID %s ----- URL %s", callNumber, sensor_id, url) # sanity check... also keeping track of how many calls in the run so that I don't overrun!
+        try:
+            response = _get(url, headers, pageParams, ttl, refresh=refresh)
+            response.raise_for_status() # a ban/429 that outlasted the retries is an error, not an empty (finished) page
+            data = response.json()
+            results = data.get("results", [])
+            if results:
+                if progress is not None:
+                    progress.recordPage(key, page, results)
+                yield results
+            elif progress is not None:
+                progress.recordDone(key, page - 1)
+            page += 1 
+            # verify rate limits for sanity
+            log.debug("x-ratelimit-used: %s x-ratelimit-remaining: %s x-ratelimit-reset: %s", response.headers.get("x-ratelimit-used"), response.headers.get("x-ratelimit-remaining"), response.headers.get("x-ratelimit-reset"))
+            if len(results) == 0:
+                log.debug("No more calls for %s, so breaking out of loop", sensor_id)
+                break
+        except requests.exceptions.RequestException as reqErr:
+            log.warning('Request error occurred: %s', reqErr)
+            if progress is not None:
+                log.warning("Sensor %s stopped after page %d, rerun with resume to continue from there", sensor_id, page - 1)
+            break
+        except ValueError as jsonErr:
+            log.warning('Request error occurred: %s', jsonErr)
+            if progress is not None:
+                log.warning("Sensor %s stopped after page %d, rerun with resume to continue from there", sensor_id, page - 1)
+            break
+        except KeyError as keyErr:
+            log.warning('Request error occurred: %s', keyErr)
+            break
         except Exception as e:
-            print(f'Request error occurred: {e}')
-    return df1
+            log.warning('Request error occurred: %s', e)
+            break
+
+def _fetchSensorRows(sensor_id, sensorMetadata, params, headers, counter, progress=None, resume=False, refresh=False):
+    # all hourly records for one sensor, with its metadata attached to each record
+    rows = []
+    for results in _iterSensorPages(sensor_id, params, headers, counter, progress, resume, refresh):
+        for r in results:
+            row = {**r, **sensorMetadata}  # merge hourly data + sensor metadata, with r winning out if found. Really trying not to get banned.
+            rows.append(row)
+    return rows
 
-def getHourlyAQData(sensorList):
+def _sensorJobs(sensorList, fullRefresh=False):
+    # (sensor id, metadata, request params) for every sensor that has hours to fetch, in sensorList order
+    # each sensor starts at its watermark (last loaded hour) unless fullRefresh=True re-pulls the whole 7 day window
     ids = sensorList['Sensor ID'].reset_index(drop=True).tolist()
     tfrom, tto = timestamps(7) # getting 7 days of data (delta = yesterday-7)
-    headers = {
-        "X-API-Key": XAPIKEY,
-        'Content-Type': 'application/json'
-    }
     params = {
         "datetime_from": tfrom,
         "datetime_to": tto,
         "limit": 100 # max number of results per page
     }
-    counter = 0 # counter for total number of requests made
-    allRows = []
-    for idx, sensor_id in enumerate(ids): 
-        # grab metadata for this sensor row
-        sensorMetadata = sensorList.iloc[idx].to_dict()
-
-        page = 1 
-        while True:
-            counter += 1
-            params['page'] = page
-            url = f'{BASE}/sensors/{sensor_id}/hours'
-            print(f"CALL # {counter} ----- ID {sensor_id} ----- URL {url}") # sanity check... also keeping track of how many calls in the run so that I don't overrun!
-            try:
-                response = requests.get(url, headers=headers, params=params)
-                data = response.json()
-                results = data.get("results", [])
-
-                # attach metadata to each hourly record
-                for r in results:
-                    row = {**r, **sensorMetadata}  # merge hourly data + sensor metadata, with r winning out if found. Really trying not to get banned.
-                    allRows.append(row)
-                page += 1 
-                # verify rate limits for sanity
-                print("x-ratelimit-used:", response.headers.get("x-ratelimit-used"))
-                print("x-ratelimit-reset:", response.headers.get("x-ratelimit-reset"))
-                print("x-ratelimit-limit:", response.headers.get("x-ratelimit-limit"))
-                print("x-ratelimit-remaining:", response.headers.get("x-ratelimit-remaining"))
-                if len(results) == 0:
-                    print(f"No more calls for {sensor_id}, so breaking out of loop")
-                    print("-------------------------------------")
-                    time.sleep(5)
-                    break
-
-                used = int(response.headers.get("x-ratelimit-used", 50))
-                remaining = int(response.headers.get("x-ratelimit-remaining", 1))
-                reset = int(response.headers.get("x-ratelimit-reset", 60))
-                if remaining <= 10 or used >= 50:
-                    print(f"Rate limit reached, sleeping for {reset} seconds")
-                    print(f"-------------------------------------SLEEPING {reset}s-------------------------------------")
-                    time.sleep(reset)
-                else:
-                    print("-------------Sleeping 5s before next request-------------")
-                    time.sleep(5)  
-            except requests.exceptions.RequestException as reqErr:
-                print(f'Request error occurred: {reqErr}')
-                break
-            except ValueError as jsonErr:
-                print(f'Request error occurred: {jsonErr}')
-                break
-            except KeyError as keyErr:
-                print(f'Request error occurred: {keyErr}')
-                break
-            except Exception as e:
-                print(f'Request error occurred: {e}')
-                break
+    marks = {} if fullRefresh else loadWatermarks()
+    sensorMetadata = sensorList.reset_index(drop=True).to_dict(orient='records') # grab metadata for every sensor row up front
+
+    jobs = []
+    for sensor_id, metadata in zip(ids, sensorMetadata):
+        sensorParams = params
+        mark = getWatermark(marks, "openaq", sensor_id)
+        if mark is not None:
+            if mark >= pd.Timestamp(tto, tz='UTC'):
+                log.debug("Sensor %s already loaded up to %s, skipping", sensor_id, mark)
+                continue
+            if mark > pd.Timestamp(tfrom, tz='UTC'):
+                sensorParams = {**params, "datetime_from": mark.isoformat()} # only the hours after the last loaded one
+        jobs.append((sensor_id, metadata, sensorParams))
+    return jobs
+
+def _reportRun():
+    # throttle and cache totals, logged and kept as run gauges
+    stats = limiter.stats()
+    metrics.setGauge("throttle_wait_seconds", stats['waited_seconds']) # how much of the run was throttle time
+    metrics.setGauge("rate_limited_responses", stats['throttled'])
+    metrics.setGauge("openaq_cache_hits", cacheStats['hits'])
+    log.info("Rate limiter: %s", stats)
+    log.info("OpenAQ cache: %s", dict(cacheStats))
 
-    # normalize to dataframe (now includes Sensor ID + metadata!)
-    df = pd.json_normalize(allRows)
+def _headers():
+    return {
+        "X-API-Key": XAPIKEY,
+        'Content-Type': 'application/json'
+    }
+
+def getHourlyAQData(sensorList, concurrent=False, maxWorkers=8, fullRefresh=False, resume=False):
+    # concurrent=True fetches up to maxWorkers sensors at once; rows still come back in sensorList order.
+    # page progress is recorded under .state/progress as pages land; resume=True skips sensor windows that already completed
+    # and restarts unfinished ones at their next page, instead of starting over from the first sensor.
+    # the ids of sensors whose window didn't finish are in the result's attrs["unfinished_sensors"]
+    jobs = _sensorJobs(sensorList, fullRefresh)
+    headers = _headers()
+    counter = itertools.count(1) # counter for total number of requests made
+    progress = PageProgress()
+    progress.prune(PageProgress.sensorKey(job[0]) for job in jobs) # sensors this run no longer fetches
+    fetch = lambda job: _fetchSensorRows(job[0], job[1], job[2], headers, counter, progress, resume, fullRefresh) # a full refresh bypasses the response cache too
+
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            perSensor = list(pool.map(fetch, jobs)) # map keeps input order, so results line up with sensorList
+    else:
+        perSensor = [fetch(job) for job in jobs]
+    allRows = [row for rows in perSensor for row in rows]
+
+    unfinished = [job[0] for job in jobs if not progress.status(PageProgress.sensorKey(job[0]))["done"]]
+    if unfinished:
+        log.warning("%d of %d sensors didn't finish (e.g. %s), rerun with resume to pick them up where they stopped", len(unfinished), len(jobs), unfinished[:5])
+    metrics.setGauge("openaq_unfinished_sensors", len(unfinished))
+    _reportRun()
+
+    df = normalizeHours(allRows)
+    df.attrs["unfinished_sensors"] = unfinished
     return df
+
+def normalizeHours(rows):
+    # normalize to dataframe (now includes Sensor ID + metadata!), with compact dtypes from the start
+    return compactFrame(pd.json_normalize(rows))
+
+def iterHourlyAQPages(sensorList, fullRefresh=False):
+    # streaming version of getHourlyAQData: yields one normalized DataFrame per page as it arrives,
+    # so nothing bigger than a page is ever held in memory
+    headers = _headers()
+    counter = itertools.count(1)
+    for sensor_id, metadata, params in _sensorJobs(sensorList, fullRefresh):
+        for results in _iterSensorPages(sensor_id, params, headers, counter, refresh=fullRefresh):
+            page = pd.json_normalize(results)
+            for col, value in metadata.items():
+                page[col] = value # one column assignment per page instead of copying metadata into every record
+            yield page
+
+def writeHourlyAQ(df, root=LAKE_ROOT):
+    # appends raw hourly rows (getHourlyAQData output or streamed pages) to the lake's openaq_hours dataset
+    df = df.copy()
+    for col in [c for c in df.columns if c.endswith('.utc')]:
+        df[col] = toUtc(df[col], OPENAQ_UTC_FORMAT) # stored as real timestamps, not strings
+    writeDataset(df, OPENAQ_HOURS, 'City', 'period.datetimeFrom.utc', root=root)
+
+def writeHourlyAQPartitions(sensorList, fullRefresh=False, flushRows=50_000, root=LAKE_ROOT):
+    # streams pages into the lake's openaq_hours dataset (city/day partitions), for backfills too big to hold in memory.
+    # pages are buffered up to flushRows so we don't end up with one tiny Parquet file per page. Read back with cleaned_partitions()
+    buffered = []
+    bufferedRows = 0
+    pages = 0
+
+    def flush():
+        if buffered:
+            writeHourlyAQ(pd.concat(buffered, ignore_index=True), root)
+            buffered.clear()
+
+    for page in iterHourlyAQPages(sensorList, fullRefresh):
+        buffered.append(page)
+        bufferedRows += len(page)
+        pages += 1
+        if bufferedRows >= flushRows:
+            flush()
+            bufferedRows = 0
+    flush()
+    log.info("Wrote %d pages to %s", pages, root)
+    _reportRun()
+    return root
+
 # aqSensors = getOpenAQSensors()
 # display(getHourlyAQData(aqSensors))
\ No newline at end of file
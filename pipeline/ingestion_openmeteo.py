@@ -1,138 +1,158 @@
 from readline import redisplay
+import json
+import logging
+import os
+import numpy as np
 import openmeteo_requests
 import pandas as pd
 import requests_cache
 from retry_requests import retry
+from .watermarks import loadWatermarks, weatherWatermark
+from .timeutils import toUtc, localWallTime
+from .catalog import loadCities
+from .metrics import metrics, getLogger
+from .schema import compactFrame, alignCategories
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+URL = os.getenv("OPENMETEO_URL", "https://api.open-meteo.com/v1/forecast") # point at benchmarks/mock_api.py for offline/load testing
+# Requested variables live in config/openmeteo.json (or wherever OPENMETEO_VARIABLES points), so adding or dropping one is a config edit.
+# These are the fallbacks if the file is missing
+DAILY = ["temperature_2m_mean", "apparent_temperature_mean", "sunset", "sunrise", "weather_code"]
+HOURLY = ["temperature_2m", "apparent_temperature", "dew_point_2m", "relative_humidity_2m", "precipitation", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m", "cloud_cover", "shortwave_radiation", "snow_depth", "surface_pressure", "pressure_msl", "uv_index"]
+INT64_VARIABLES = {"sunrise", "sunset"} # unix seconds, read with ValuesInt64AsNumpy instead of ValuesAsNumpy
+ENDPOINT = urlparse(URL).path # metrics label
+log = getLogger("openmeteo")
+VARIABLES_PATH = os.getenv("OPENMETEO_VARIABLES", os.path.join(os.path.dirname(__file__), "..", "config", "openmeteo.json"))
+
+def loadVariables(path=VARIABLES_PATH):
+    # (hourly, daily) variable lists to request
+    if not os.path.exists(path):
+        return HOURLY, DAILY
+    with open(path) as f:
+        config = json.load(f)
+    return config.get("hourly", HOURLY), config.get("daily", DAILY)
+
+def decodeBlock(block, variables, city):
+    # turns one Hourly()/Daily() block into a DataFrame in a single pass over its variables.
+    # Variables(i) is variables[i] because that's the order we asked for them in, so nothing here is hard-coded per variable.
+    # floats land in one preallocated float32 block (one pandas block, no per-column copies), sunrise/sunset in an int64 one
+    times = pd.date_range(
+        start = pd.to_datetime(block.Time(), unit = "s", utc = True),
+        end = pd.to_datetime(block.TimeEnd(), unit = "s", utc = True),
+        freq = pd.Timedelta(seconds = block.Interval()),
+        inclusive = "left"
+    )
+    floatNames = [v for v in variables if v not in INT64_VARIABLES]
+    intNames = [v for v in variables if v in INT64_VARIABLES]
+    floats = np.empty((len(times), len(floatNames)), dtype=np.float32)
+    ints = np.empty((len(times), len(intNames)), dtype=np.int64)
+    for i, name in enumerate(variables):
+        if name in INT64_VARIABLES:
+            ints[:, intNames.index(name)] = block.Variables(i).ValuesInt64AsNumpy()
+        else:
+            floats[:, floatNames.index(name)] = block.Variables(i).ValuesAsNumpy()
+
+    df = pd.DataFrame(floats, columns=floatNames)
+    for j, name in enumerate(intNames):
+        df[name] = ints[:, j]
+    df.insert(0, "date", times)
+    df["City"] = city # adding City name before the frames get stacked
+    return df
+
+_client = None
+
+def _recordResponse(response, *args, **kwargs):
+    # response hook on the cached session: every Open-Meteo response, its body size and status as they came off the wire,
+    # after urllib3's retries. requests_cache runs the hooks twice for a network response, on the raw response and again
+    # once it's cached; only the second pass (the one with from_cache set) is counted
+    if hasattr(response, 'from_cache'):
+        metrics.recordCall(ENDPOINT, len(response.content), response.status_code, cached=response.from_cache)
+
+def _getClient():
+    # one long-lived Open-Meteo client (and one SQLite cache) for the whole process instead of one per city
+    global _client
+    if _client is None:
+        # Setup the Open-Meteo API client with cache and retry on error
+        cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
+        cache_session.hooks['response'].append(_recordResponse)
+        retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
+        _client = openmeteo_requests.Client(session = retry_session)
+    return _client
 
 # API setup from https://open-meteo.com/en/docs selection
-def getOpenMeteoData():
+def getOpenMeteoData(fullRefresh=False, chunkSize=100, hourlyVariables=None, dailyVariables=None, cities=None, maxWorkers=4, sensors=None):
+    # each city only asks for the days since its watermark (last loaded hour); fullRefresh=True re-pulls the full 8 days.
+    # with sensors (getOpenAQSensors output) a city's start is held back to its furthest-behind sensor's watermark
+    # cities (the catalog by default) go out chunkSize at a time as one multi-location request, up to maxWorkers chunks in parallel;
+    # Open-Meteo answers with one response per location, in order
+    marks = {} if fullRefresh else loadWatermarks()
+    today = pd.Timestamp.now(tz='UTC').normalize()
     # multiple cities dict with keys for city, lat, long, tz 
-    cities = [
-        {"City": "Los Angeles", "Latitude": 34.0522, "Longitude": -118.2437, "Timezone": "America/Los_Angeles"},
-        {"City": "New York", "Latitude": 40.7128, "Longitude": -74.0060, "Timezone": "America/New_York"},
-        {"City": "Chicago", "Latitude": 41.8781, "Longitude": -87.6298, "Timezone": "America/Chicago"},
-        {"City": "Houston", "Latitude": 29.7604, "Longitude": -95.3698, "Timezone": "America/Chicago"},
-    ]
+    cities = cities or loadCities()
+    sensorIds = {} if sensors is None else sensors.groupby('City', observed=True)['Sensor ID'].agg(list).to_dict()
 
-    # empty for appending df data 
-    allHourly = []
-    allDaily = []
+    configHourly, configDaily = loadVariables()
+    hourlyVariables = hourlyVariables or configHourly
+    dailyVariables = dailyVariables or configDaily
+    openmeteo = _getClient()
 
-    for info in cities:
-        city = info['City']
-        lat = info['Latitude']
-        long = info['Longitude']
-        tzone = info['Timezone']
+    def fetchChunk(chunk):
+        # (hourly frames, daily frames) for one chunk of cities
+        chunkHourly = []
+        chunkDaily = []
+        chunkMarks = [weatherWatermark(marks, info['City'], sensorIds.get(info['City'], ())) for info in chunk]
+        pastDays = max(8 if mark is None else int(min(8, max(1, (today - mark.normalize()).days + 1))) for mark in chunkMarks) # enough days for the furthest-behind city in the chunk
 
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-        retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-        openmeteo = openmeteo_requests.Client(session = retry_session)
-
-        # Make sure all required weather variables are listed here
-        # The order of variables in hourly or daily is important to assign them correctly below
-        url = "https://api.open-meteo.com/v1/forecast"
         params = {
-            "latitude": lat,
-            "longitude": long,
-            "daily": ["temperature_2m_mean", "apparent_temperature_mean", "sunset", "sunrise", "weather_code"],
-            "hourly": ["temperature_2m", "apparent_temperature", "dew_point_2m", "relative_humidity_2m", "precipitation", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m", "cloud_cover", "shortwave_radiation", "snow_depth", "surface_pressure", "pressure_msl", "uv_index"],
-            "timezone": tzone,
-            "past_days": 8,
+            "latitude": [info['Latitude'] for info in chunk],
+            "longitude": [info['Longitude'] for info in chunk],
+            "daily": dailyVariables,
+            "hourly": hourlyVariables,
+            "timezone": [info['Timezone'] for info in chunk],
+            "past_days": pastDays,
             "forecast_days": 0,
         }
-        responses = openmeteo.weather_api(url, params=params)
-        # Process first location. FOR-loop added for parsing multiple locations
-        for i in responses:
-            response = i
-            print(f"Coordinates: {response.Latitude()}°N {response.Longitude()}°E")
-            print(f"Elevation: {response.Elevation()} m asl")
-            print(f"Timezone: {response.Timezone()}{response.TimezoneAbbreviation()}")
-            print(f"Timezone difference to GMT+0: {response.UtcOffsetSeconds()}s")
-            print("-------------------------------------------------------------------")
-            hourly = response.Hourly()
-
-            # Process hourly data. The order of variables needs to be the same as requested.
-            hourly = response.Hourly()
-            hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-            hourly_apparent_temperature = hourly.Variables(1).ValuesAsNumpy()
-            hourly_dew_point_2m = hourly.Variables(2).ValuesAsNumpy()
-            hourly_relative_humidity_2m = hourly.Variables(3).ValuesAsNumpy()
-            hourly_precipitation = hourly.Variables(4).ValuesAsNumpy()
-            hourly_wind_speed_10m = hourly.Variables(5).ValuesAsNumpy()
-            hourly_wind_direction_10m = hourly.Variables(6).ValuesAsNumpy()
-            hourly_wind_gusts_10m = hourly.Variables(7).ValuesAsNumpy()
-            hourly_cloud_cover = hourly.Variables(8).ValuesAsNumpy()
-            hourly_shortwave_radiation = hourly.Variables(9).ValuesAsNumpy()
-            hourly_snow_depth = hourly.Variables(10).ValuesAsNumpy()
-            hourly_surface_pressure = hourly.Variables(11).ValuesAsNumpy()
-            hourly_pressure_msl = hourly.Variables(12).ValuesAsNumpy()
-            hourly_uv_index = hourly.Variables(13).ValuesAsNumpy()
-
-            hourly_data = {"date": pd.date_range(
-                start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-                end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-                freq = pd.Timedelta(seconds = hourly.Interval()),
-                inclusive = "left"
-            )}
-
-            hourly_data["temperature_2m"] = hourly_temperature_2m
-            hourly_data["apparent_temperature"] = hourly_apparent_temperature
-            hourly_data["dew_point_2m"] = hourly_dew_point_2m
-            hourly_data["relative_humidity_2m"] = hourly_relative_humidity_2m
-            hourly_data["precipitation"] = hourly_precipitation
-            hourly_data["wind_speed_10m"] = hourly_wind_speed_10m
-            hourly_data["wind_direction_10m"] = hourly_wind_direction_10m
-            hourly_data["wind_gusts_10m"] = hourly_wind_gusts_10m
-            hourly_data["cloud_cover"] = hourly_cloud_cover
-            hourly_data["shortwave_radiation"] = hourly_shortwave_radiation
-            hourly_data["snow_depth"] = hourly_snow_depth
-            hourly_data["surface_pressure"] = hourly_surface_pressure
-            hourly_data["pressure_msl"] = hourly_pressure_msl
-            hourly_data["uv_index"] = hourly_uv_index
-
-            hourly_dataframe = pd.DataFrame(data = hourly_data) # creating hourly dataframe
-            hourly_dataframe["City"] = city # adding City name to hourly df before appending to all list
-            allHourly.append(hourly_dataframe) # appending dataframe to list
-
-            # Process daily data. The order of variables needs to be the same as requested.
-            daily = response.Daily()
-            daily_temperature_2m_mean = daily.Variables(0).ValuesAsNumpy()
-            daily_apparent_temperature_mean = daily.Variables(1).ValuesAsNumpy()
-            daily_sunset = daily.Variables(2).ValuesInt64AsNumpy()
-            daily_sunrise = daily.Variables(3).ValuesInt64AsNumpy()
-            daily_weather_code = daily.Variables(4).ValuesAsNumpy()
-
-            daily_data = {"date": pd.date_range(
-                start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-                end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-                freq = pd.Timedelta(seconds = daily.Interval()),
-                inclusive = "left"
-            )}
-
-            daily_data["temperature_2m_mean"] = daily_temperature_2m_mean
-            daily_data["apparent_temperature_mean"] = daily_apparent_temperature_mean
-            daily_data["sunset"] = daily_sunset
-            daily_data["sunrise"] = daily_sunrise
-            daily_data["weather_code"] = daily_weather_code
-
-            daily_dataframe = pd.DataFrame(data = daily_data) # creating daily dataframe
-            daily_dataframe["City"] = city # appending city name to dataframe before appending df data to list
-            allDaily.append(daily_dataframe) # appending dataframe to list
-
-            print("APPENDED TO DAILY/HOURLY MAIN DATAFRAMES")
+        responses = openmeteo.weather_api(URL, params=params) # counted in metrics by _recordResponse
+        if len(responses) != len(chunk):
+            raise ValueError(f"Open-Meteo returned {len(responses)} locations for {len(chunk)} cities")
+        # responses come back in request order, so index i is chunk[i]
+        for info, mark, response in zip(chunk, chunkMarks, responses):
+            city = info['City']
+            if log.isEnabledFor(logging.DEBUG): # the accessors decode the flatbuffer, skip them unless someone is reading
+                log.debug(f"{city}: {response.Latitude()}°N {response.Longitude()}°E, {response.Elevation()} m asl, {response.Timezone()}{response.TimezoneAbbreviation()} (GMT{response.UtcOffsetSeconds():+d}s)")
+            hourly_dataframe = decodeBlock(response.Hourly(), hourlyVariables, city) # creating hourly dataframe
+            if mark is not None:
+                hourly_dataframe = hourly_dataframe[hourly_dataframe['date'] > mark].reset_index(drop=True) # dropping hours we already loaded
+            chunkHourly.append(hourly_dataframe)
+
+            daily_dataframe = decodeBlock(response.Daily(), dailyVariables, city) # creating daily dataframe
+            chunkDaily.append(daily_dataframe)
+        return chunkHourly, chunkDaily
+
+    chunks = [cities[start:start + chunkSize] for start in range(0, len(cities), chunkSize)]
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+        results = list(pool.map(fetchChunk, chunks)) # map keeps chunk order, so frames stay in catalog order
+
+    # empty for appending df data 
+    allHourly = [df for chunkHourly, _ in results for df in chunkHourly]
+    allDaily = [df for _, chunkDaily in results for df in chunkDaily]
+    log.info("Open-Meteo: %d cities in %d requests", len(allDaily), len(chunks))
     
-    # creating new dataframe with all hourly and daily information
-    hourlyMain = pd.concat(allHourly, ignore_index=True)
-    dailyMain = pd.concat(allDaily, ignore_index=True)
+    # creating new dataframe with all hourly and daily information, one concat for all cities
+    hourlyMain = compactFrame(pd.concat(allHourly, ignore_index=True))
+    dailyMain = compactFrame(pd.concat(allDaily, ignore_index=True))
 
     return dailyMain, hourlyMain, cities # returning cities dict created for timeozne changes in merges
 # getOpenMeteoData()
 
 def mergeDataframes(daily, hourly, cities):
-    hourly['hourly_datetime (UTC)'] = pd.to_datetime(hourly['date']) # preserving hourly UTC datetime data for matching against openaq
-    hourly['date'] = pd.to_datetime(hourly['date']).dt.date
-    daily['date'] = pd.to_datetime(daily['date']).dt.date  # only keep date part
+    compactFrame(hourly)
+    compactFrame(daily)
+    alignCategories(hourly, 'City', daily, 'City') # merge on the category codes
+    hourly['hourly_datetime (UTC)'] = toUtc(hourly['date']) # preserving hourly UTC datetime data for matching against openaq
+    hourly['date'] = hourly['hourly_datetime (UTC)'].dt.floor('D')
+    daily['date'] = toUtc(daily['date']).dt.floor('D')  # only keep date part (still a datetime, python date objects are slow to merge on)
 
     # merge on dates
     df = pd.merge(
@@ -145,12 +165,13 @@ def mergeDataframes(daily, hourly, cities):
     timezone_map = {c['City']: c['Timezone'] for c in cities} # dictionary mapping city and timezone from cities dict
     df['timezone'] = df['City'].map(timezone_map) # taking mapping from above and assigning it to df['timezone'] (aka replacing found city with timezone)
 
-    # convert sunrise/sunset to local timezone
-    df['sunrise_local'] = pd.to_datetime(df['sunrise'], unit='s', utc=True)
-    df['sunset_local']  = pd.to_datetime(df['sunset'], unit='s', utc=True)
-    df['sunrise_local'] = df.apply(lambda row: row['sunrise_local'].tz_convert(row['timezone']), axis=1)
-    df['sunset_local']  = df.apply(lambda row: row['sunset_local'].tz_convert(row['timezone']), axis=1)
+    # sunrise/sunset stored as a UTC instant plus the timezone column, and as local wall-clock time converted one timezone at a time
+    # (either can be left out of the daily variables)
+    suntimes = [col for col in ('sunrise', 'sunset') if col in df.columns]
+    for col in suntimes:
+        df[f'{col}_utc'] = pd.to_datetime(df[col], unit='s', utc=True)
+        df[f'{col}_local'] = localWallTime(df[f'{col}_utc'], df['timezone'])
 
-    df.drop(columns=['date', 'sunrise', 'sunset', 'timezone'], inplace=True)
+    df.drop(columns=['date', *suntimes], inplace=True)
     df = df[sorted(df.columns)]
-    return df
\ No newline at end of file
+    return compactFrame(df)
\ No newline at end of file
@@ -0,0 +1,33 @@
+# Content-addressed row keys for the cleaned table.
+# The key is a 64-bit hash of the natural key columns, so the same observation gets the same unique_id on every run
+# and it can be used directly as the upsert / dedup key.
+
+import numpy as np
+import pandas as pd
+
+# the grain of cleaned_data: one row per city, parameter and hour (sensors are already averaged together per city)
+KEY_COLUMNS = ['sensor_city', 'parameter_name', 'hourly_datetime_utc']
+
+_HEX = np.array([f'{i:02x}' for i in range(256)]) # byte -> two hex characters
+
+def rowKeys(df, columns=KEY_COLUMNS):
+    # 16 hex character key per row, hashed column-wise in C by pandas (no per-row Python)
+    keyFrame = df[columns]
+    timeCols = [c for c in columns if pd.api.types.is_datetime64_any_dtype(keyFrame[c].dtype)]
+    if timeCols:
+        # datetimes hash as their int64 value, which depends on the unit; pin it to ns (what every key so far was made from)
+        # so frames parsed or read back at another resolution keep the same unique_id
+        keyFrame = keyFrame.assign(**{c: keyFrame[c].dt.as_unit('ns') for c in timeCols})
+    hashes = pd.util.hash_pandas_object(keyFrame, index=False).to_numpy()
+    octets = hashes.astype('>u8').view(np.uint8).reshape(-1, 8) # big-endian bytes of each hash
+    hexed = _HEX[octets].view('<U16').ravel() # eight 2-char strings side by side in memory are one 16-char string
+    return pd.Series(hexed, index=df.index, dtype=object)
+
+def checkCollisions(df, keys, columns=KEY_COLUMNS):
+    # keys are a function of the natural key, so there's a collision exactly when there are fewer distinct keys than distinct natural keys
+    if not keys.duplicated().any():
+        return
+    naturalCount = len(df[columns].drop_duplicates())
+    keyCount = keys.nunique()
+    if keyCount < naturalCount:
+        raise ValueError(f"row key collision: {naturalCount} distinct {columns} rows hashed to {keyCount} keys")
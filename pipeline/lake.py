@@ -0,0 +1,117 @@
+# Partitioned Parquet data lake: root/source=<source>/city=<city>/day=<YYYY-MM-DD>/*.parquet
+# Raw OpenAQ hours, raw Open-Meteo hours and the cleaned output all land here, zstd-compressed with their column types kept,
+# so reprocessing and ad-hoc analysis read only the partitions and columns they ask for instead of re-parsing whole CSVs.
+
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from .timeutils import toUtc
+from .schema import storageFrame
+
+LAKE_ROOT = os.getenv("ZEPHYR_LAKE", "data/lake")
+
+# sources written by the pipeline
+OPENAQ_HOURS = "openaq_hours"
+OPENMETEO_HOURS = "openmeteo_hours"
+CLEANED = "cleaned"
+
+# columns identifying a row in each source; writing a row again replaces it instead of adding a second copy
+SOURCE_KEYS = {
+    OPENAQ_HOURS: ['Sensor ID', 'period.datetimeFrom.utc'],
+    OPENMETEO_HOURS: ['City', 'date'],
+    CLEANED: ['unique_id'],
+}
+
+PARTITIONING = ds.partitioning(pa.schema([("city", pa.string()), ("day", pa.string())]), flavor="hive")
+
+def _sourcePath(source, root):
+    return os.path.join(root, f"source={source}")
+
+def writeDataset(df, source, cityCol, timeCol, root=LAKE_ROOT, compression="zstd", key=None):
+    # writes df into the source's dataset, partitioned by city and by the UTC day of timeCol.
+    # with a key (SOURCE_KEYS[source] by default) every partition df touches is rewritten from its existing rows plus df,
+    # the newest row per key winning, so a window fetched twice (full refresh, a retried batch) isn't in the lake twice.
+    # The new files land before the old ones are removed: a crash in between leaves duplicates the next write of that partition drops
+    if df.empty:
+        return
+    key = key or SOURCE_KEYS.get(source)
+    out = storageFrame(df)
+    out["city"] = out[cityCol].astype(str)
+    out["day"] = toUtc(out[timeCol]).dt.strftime("%Y-%m-%d")
+    replaced = []
+    if key:
+        files = _partitionFiles(source, root) # one listing of the source, not one per touched partition
+        for city, day in out[["city", "day"]].drop_duplicates().itertuples(index=False):
+            replaced += files.get((city, day), [])
+        if replaced:
+            out = pd.concat([_readFiles(source, replaced, root=root), out], ignore_index=True).drop_duplicates(key, keep="last")
+    out.to_parquet(
+        _sourcePath(source, root), partition_cols=["city", "day"], compression=compression, index=False,
+        basename_template=f"part-{time.time_ns():020d}-{{i}}.parquet", # named by write time so reading in path order keeps row order
+    )
+    for path in replaced:
+        os.remove(path)
+
+def _partitionFiles(source, root=LAKE_ROOT):
+    # {(city, day): file paths in write order} for every partition of a source
+    path = _sourcePath(source, root)
+    files = {}
+    if not os.path.exists(path):
+        return files
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    for fragment in sorted(dataset.get_fragments(), key=lambda f: f.path):
+        values = ds.get_partition_keys(fragment.partition_expression)
+        files.setdefault((values["city"], values["day"]), []).append(fragment.path)
+    return files
+
+def _readFiles(source, paths, columns=None, expr=None, root=LAKE_ROOT):
+    # the given files of a source as one frame, city/day included.
+    # pages can disagree on types (an int-only page vs a float one, an all-null column), so unify over the files we'll actually read
+    base = _sourcePath(source, root)
+    fragments = ds.dataset(paths, format="parquet", partitioning=PARTITIONING, partition_base_dir=base).get_fragments()
+    schema = pa.unify_schemas([f.physical_schema for f in fragments] + [PARTITIONING.schema], promote_options="permissive")
+    dataset = ds.dataset(paths, schema=schema, format="parquet", partitioning=PARTITIONING, partition_base_dir=base)
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+def _filter(cities=None, start=None, end=None):
+    # partition filter; city/day are directory names so anything excluded here is never opened
+    expr = None
+    parts = []
+    if cities is not None:
+        parts.append(ds.field("city").isin(list(cities)))
+    if start is not None:
+        parts.append(ds.field("day") >= pd.Timestamp(start).strftime("%Y-%m-%d"))
+    if end is not None:
+        parts.append(ds.field("day") <= pd.Timestamp(end).strftime("%Y-%m-%d"))
+    for part in parts:
+        expr = part if expr is None else expr & part
+    return expr
+
+def readDataset(source, columns=None, cities=None, start=None, end=None, root=LAKE_ROOT):
+    # reads only the partitions matching cities/start/end (inclusive days) and only the requested columns
+    path = _sourcePath(source, root)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    expr = _filter(cities, start, end)
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    fragments = sorted(dataset.get_fragments(filter=expr), key=lambda f: f.path)
+    if not fragments:
+        return pd.DataFrame(columns=columns)
+    return _readFiles(source, [f.path for f in fragments], columns, expr, root)
+
+def listPartitions(source, root=LAKE_ROOT):
+    # {"city": ..., "day": ...} for every partition of a source, in sorted order
+    path = _sourcePath(source, root)
+    if not os.path.exists(path):
+        return []
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    found = {tuple(sorted(ds.get_partition_keys(f.partition_expression).items())) for f in dataset.get_fragments()}
+    return [dict(p) for p in sorted(found)]
+
+def iterPartitions(source, columns=None, root=LAKE_ROOT):
+    # (partition values, DataFrame) one city/day at a time, so memory stays at one partition
+    for values in listPartitions(source, root):
+        yield values, readDataset(source, columns, cities=[values["city"]], start=values["day"], end=values["day"], root=root)
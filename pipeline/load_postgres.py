@@ -0,0 +1,128 @@
+# Loading cleaned batches into Postgres.
+# The target table is created once and never dropped: each batch goes into a temp staging table
+# and is merged in with INSERT ... ON CONFLICT (unique_id) DO UPDATE, touching only new or changed rows.
+
+import io
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import Table, MetaData, Column, String, Integer, Float, DateTime, inspect, insert, text
+
+from .metrics import metrics, getLogger
+
+log = getLogger("load")
+
+def _sqlType(dtype):
+    if pd.api.types.is_integer_dtype(dtype):
+        return Integer
+    elif pd.api.types.is_float_dtype(dtype):
+        return Float
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        return DateTime
+    return String
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"' # camelCase columns like "datetimeFrom_utc" need quoting
+
+def ensureTable(engine, df, table_name, key='unique_id'):
+    # create the table from the DataFrame dtypes if it's missing, add any new columns, and make sure the key is unique
+    metadata = MetaData()
+    cols = [Column(name, _sqlType(dtype), primary_key=(name == key)) for name, dtype in zip(df.columns, df.dtypes)]
+    table = Table(table_name, metadata, *cols)
+    metadata.create_all(engine) # no-op if the table is already there
+
+    existing = {c['name'] for c in inspect(engine).get_columns(table_name)}
+    with engine.begin() as conn:
+        for col in table.columns:
+            if col.name not in existing:
+                conn.execute(text(f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(col.name)} {col.type.compile(dialect=engine.dialect)}"))
+        # tables created before the upsert path have no key on unique_id, ON CONFLICT needs one
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(table_name + '_' + key + '_key')} ON {_quote(table_name)} ({_quote(key)})"))
+    return table
+
+def _csvTable(df):
+    # Arrow table for the CSV writer: tz-aware times as naive UTC (the columns are timestamp without time zone), at microseconds like Postgres.
+    # NaN becomes null, which the writer leaves as an empty unquoted field
+    cols = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert(None)
+        if pd.api.types.is_datetime64_dtype(values.dtype):
+            values = values.astype('datetime64[us]')
+        cols[col] = values
+    return pa.Table.from_pandas(pd.DataFrame(cols), preserve_index=False)
+
+def iterCsvChunks(df, chunkRows=100_000):
+    # the frame as UTF-8 CSV, chunkRows rows at a time (a binary buffer, which copy_expert reads as is), so only one chunk is ever held as text.
+    # written by pyarrow's CSV writer: pandas' to_csv managed 10-20k rows/sec, half of it formatting the tz-aware datetimes
+    for start in range(0, len(df), chunkRows):
+        buf = io.BytesIO()
+        pacsv.write_csv(_csvTable(df.iloc[start:start + chunkRows]), buf, pacsv.WriteOptions(include_header=False))
+        buf.seek(0)
+        yield buf
+
+def copyDataframe(conn, df, table_name, chunkRows=100_000):
+    # bulk load with COPY ... FROM STDIN instead of executemany over a dict per row
+    # returns (rows, seconds)
+    started = time.perf_counter()
+    cols = ", ".join(_quote(c) for c in df.columns)
+    sql = f"COPY {_quote(table_name)} ({cols}) FROM STDIN WITH (FORMAT csv)" # empty unquoted fields load as NULL, which is how to_csv writes NaN/None
+    cursor = conn.connection.cursor() # raw psycopg2 cursor on the same transaction
+    try:
+        for buf in iterCsvChunks(df, chunkRows):
+            cursor.copy_expert(sql, buf)
+    finally:
+        cursor.close()
+    return len(df), time.perf_counter() - started
+
+def upsertDataframe(engine, df, table, key='unique_id', replace=False, ignore=('gen_timestamp',), method='copy', chunkRows=100_000,
+                    cityCol='sensor_city', timeCol='datetimeFrom_utc'):
+    # stage the batch, then merge it into table. Rows whose values (apart from the ignore columns) are unchanged aren't rewritten.
+    # replace=True also deletes the rows the batch no longer has, in the same transaction so readers never see them go missing.
+    # Only the window the batch covers is replaced: per city, rows from the batch's earliest timeCol on; older history stays.
+    # method='copy' streams the batch into the stage with COPY in chunkRows pieces, 'insert' uses executemany
+    # returns the number of rows inserted or updated
+    cols = [c for c in df.columns if c in table.columns]
+    updateCols = [c for c in cols if c != key]
+    compareCols = [c for c in updateCols if c not in ignore]
+
+    stage = Table(
+        f"{table.name}_stage", MetaData(),
+        *[Column(c, table.columns[c].type) for c in cols],
+        prefixes=['TEMPORARY'], postgresql_on_commit='DROP',
+    )
+    colList = ", ".join(_quote(c) for c in cols)
+    merge = f"""
+        INSERT INTO {_quote(table.name)} ({colList})
+        SELECT DISTINCT ON ({_quote(key)}) {colList} FROM {_quote(stage.name)} ORDER BY {_quote(key)}
+        ON CONFLICT ({_quote(key)}) DO UPDATE SET
+            {", ".join(f"{_quote(c)} = EXCLUDED.{_quote(c)}" for c in updateCols)}
+    """
+    if compareCols:
+        merge += f"""
+        WHERE ({", ".join(f"{_quote(table.name)}.{_quote(c)}" for c in compareCols)})
+            IS DISTINCT FROM ({", ".join(f"EXCLUDED.{_quote(c)}" for c in compareCols)})
+        """
+
+    with engine.begin() as conn:
+        stage.create(conn)
+        if method == 'copy':
+            rows, seconds = copyDataframe(conn, df[cols], stage.name, chunkRows)
+        else:
+            started = time.perf_counter()
+            conn.execute(insert(stage), df[cols].to_dict(orient="records"))
+            rows, seconds = len(df), time.perf_counter() - started
+        log.info("Staged %d rows via %s in %.2fs (%s rows/sec)", rows, method, seconds, f"{rows / max(seconds, 1e-9):,.0f}")
+        metrics.recordStage("stage_" + method, seconds=seconds, rowsIn=len(df), rowsOut=rows)
+        if replace:
+            starts = df.groupby(cityCol, observed=True)[timeCol].min()
+            conn.execute(text(f"""
+                DELETE FROM {_quote(table.name)} t
+                USING unnest(CAST(:cities AS TEXT[]), CAST(:starts AS TIMESTAMP[])) AS w(city, start)
+                WHERE t.{_quote(cityCol)} = w.city AND t.{_quote(timeCol)} >= w.start
+                    AND t.{_quote(key)} NOT IN (SELECT {_quote(key)} FROM {_quote(stage.name)})
+            """), {"cities": [str(c) for c in starts.index], "starts": [ts.to_pydatetime() for ts in pd.to_datetime(starts, utc=True).dt.tz_convert(None)]})
+        written = conn.execute(text(merge)).rowcount
+    return written
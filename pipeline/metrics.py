@@ -0,0 +1,144 @@
+# Run instrumentation: per-stage durations and rows in/out, API calls/bytes/errors per endpoint, throttle wait and peak RSS.
+# Everything is collected in memory on the shared `metrics` object (thread safe, the fetches run on pools) and written once
+# at the end of a run by emit(): one JSON line appended to METRICS_PATH, for trending, and a Prometheus textfile at PROM_PATH
+# (for node_exporter's textfile collector), for alerting.
+# Logging for the pipeline modules goes through getLogger(), at the level in ZEPHYR_LOG_LEVEL (DEBUG shows every request).
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+LOG_LEVEL = os.getenv("ZEPHYR_LOG_LEVEL", "INFO").upper()
+METRICS_PATH = os.getenv("ZEPHYR_METRICS", ".state/metrics.jsonl")
+PROM_PATH = os.getenv("ZEPHYR_PROM_TEXTFILE", ".state/zephyr.prom")
+
+def getLogger(name):
+    # "zephyr.<name>"; the first call sets up the shared stderr handler
+    root = logging.getLogger("zephyr")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return logging.getLogger(f"zephyr.{name}")
+
+def peakRssBytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # bytes on macOS, KiB on Linux
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {} # name -> {"seconds", "rows_in", "rows_out", "cached"}
+            self.api = {} # endpoint -> {"calls", "bytes", "errors", "cache_hits"}
+            self.gauges = {}
+
+    def recordStage(self, name, seconds=None, rowsIn=None, rowsOut=None, cached=None):
+        # fields left as None keep whatever was recorded before, so timing and row counts can come from different places
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": None, "rows_in": None, "rows_out": None, "cached": None})
+            for key, value in (("seconds", seconds), ("rows_in", rowsIn), ("rows_out", rowsOut), ("cached", cached)):
+                if value is not None:
+                    stage[key] = round(value, 4) if isinstance(value, float) else value
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.recordStage(name, seconds=time.perf_counter() - started)
+
+    def recordCall(self, endpoint, nbytes=0, status=200, cached=False):
+        with self._lock:
+            api = self.api.setdefault(endpoint, {"calls": 0, "bytes": 0, "errors": 0, "cache_hits": 0})
+            if cached:
+                api["cache_hits"] += 1 # answered from the local cache, nothing went over the network
+                return
+            api["calls"] += 1
+            api["bytes"] += nbytes
+            if status >= 400:
+                api["errors"] += 1
+
+    def setGauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            return {
+                "started": round(self.started, 3),
+                "finished": round(now, 3),
+                "duration_seconds": round(now - self.started, 3),
+                "stages": {name: dict(values) for name, values in self.stages.items()},
+                "api": {name: dict(values) for name, values in self.api.items()},
+                "gauges": dict(self.gauges),
+                "peak_rss_bytes": peakRssBytes(),
+            }
+
+    def emit(self, path=METRICS_PATH, promPath=PROM_PATH):
+        # appends this run's JSON line and rewrites the Prometheus textfile; returns the snapshot
+        run = self.snapshot()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(run, default=str) + "\n")
+        os.makedirs(os.path.dirname(promPath) or ".", exist_ok=True)
+        tmp = promPath + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheusText(run))
+        os.replace(tmp, promPath) # the collector must never read a half-written file
+        getLogger("metrics").info("Run metrics written to %s and %s", path, promPath)
+        return run
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def prometheusText(run):
+    # Prometheus text exposition of one run snapshot; everything is a gauge describing the last run
+    lines = []
+
+    def metric(name, help, samples):
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP zephyr_{name} {help}")
+        lines.append(f"# TYPE zephyr_{name} gauge")
+        for labels, value in samples:
+            labelText = ",".join(f'{key}="{_label(v)}"' for key, v in labels.items())
+            lines.append(f"zephyr_{name}{{{labelText}}} {float(value)}" if labelText else f"zephyr_{name} {float(value)}")
+
+    stages, api = run["stages"], run["api"]
+    metric("run_timestamp_seconds", "Unix time the last run finished.", [({}, run["finished"])])
+    metric("run_duration_seconds", "Wall time of the last run.", [({}, run["duration_seconds"])])
+    metric("peak_rss_bytes", "Peak resident set size of the last run.", [({}, run["peak_rss_bytes"])])
+    metric("stage_duration_seconds", "Wall time per stage.", [({"stage": s}, v["seconds"]) for s, v in stages.items()])
+    metric("stage_rows_in", "Rows going into a stage.", [({"stage": s}, v["rows_in"]) for s, v in stages.items()])
+    metric("stage_rows_out", "Rows coming out of a stage.", [({"stage": s}, v["rows_out"]) for s, v in stages.items()])
+    metric("stage_from_checkpoint", "1 if the stage was loaded from a checkpoint.", [({"stage": s}, v["cached"]) for s, v in stages.items()])
+    metric("api_calls", "API requests sent per endpoint.", [({"endpoint": e}, v["calls"]) for e, v in api.items()])
+    metric("api_bytes", "Response bytes received per endpoint.", [({"endpoint": e}, v["bytes"]) for e, v in api.items()])
+    metric("api_errors", "Responses with status >= 400 per endpoint.", [({"endpoint": e}, v["errors"]) for e, v in api.items()])
+    metric("api_cache_hits", "Requests answered from the local response cache per endpoint.", [({"endpoint": e}, v["cache_hits"]) for e, v in api.items()])
+    for name, value in sorted(run["gauges"].items()):
+        metric(name, f"{name.replace('_', ' ')} of the last run.", [({}, value)])
+    return "\n".join(lines) + "\n"
+
+metrics = RunMetrics() # shared by every module in the run
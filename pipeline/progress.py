@@ -0,0 +1,123 @@
+# Durable per-sensor page progress for the OpenAQ hours fetch.
+# Every page that lands is spooled to disk and recorded in an append-only journal (sensor window, last completed page,
+# done or not), so after a crash, a request error or a rate-limit ban a resumed run replays the finished pages from disk
+# and only goes back to the API from the first page that never completed.
+# Progress is keyed on the sensor; the window it was fetched for (datetime_from, datetime_to) is kept in the journal entry,
+# because datetime_to moves every day and a key holding it would never match on a resume after midnight.
+# prune() drops sensors the current run no longer fetches; once the batch is loaded and the watermarks move, clearProgress() drops it all.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+PROGRESS_DIR = os.getenv("ZEPHYR_PROGRESS", ".state/progress")
+
+class PageProgress:
+    def __init__(self, name="openaq_hours", root=PROGRESS_DIR):
+        self.root = os.path.join(root, name)
+        self.journalPath = os.path.join(self.root, "journal.jsonl")
+        self.pagesDir = os.path.join(self.root, "pages")
+        self.lock = threading.Lock() # sensors are fetched from several threads, the journal is shared
+        self.state = self._replay()
+
+    @staticmethod
+    def sensorKey(sensor_id):
+        return str(sensor_id)
+
+    @staticmethod
+    def window(params):
+        # the journal's copy of a request window, as the strings that went into the query
+        return str(params['datetime_from']), str(params['datetime_to'])
+
+    def _replay(self):
+        # latest record per window wins
+        state = {}
+        if not os.path.exists(self.journalPath):
+            return state
+        with open(self.journalPath) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # a line cut short by a crash mid-append
+                state[record["key"]] = {"page": record["page"], "done": record["done"], "from": record.get("from"), "to": record.get("to")}
+        return state
+
+    def _record(self, key, page, done, window):
+        datetimeFrom, datetimeTo = window
+        return {"key": key, "page": page, "done": done, "from": datetimeFrom, "to": datetimeTo}
+
+    def _append(self, key, page, done, window=None):
+        # window=None keeps the window the sensor was started with
+        with self.lock:
+            current = self.state.get(key, {})
+            record = self._record(key, page, done, window or (current.get("from"), current.get("to")))
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.journalPath, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno()) # the record is on disk before we move on to the next page
+            self.state[key] = {name: record[name] for name in ("page", "done", "from", "to")}
+
+    def _pagePath(self, key, page):
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.pagesDir, f"{digest}-{page:05d}.json")
+
+    def status(self, key):
+        # {"page": last completed page (0 = none), "done": whether the window's last page was reached, "from"/"to": the window}
+        return self.state.get(key, {"page": 0, "done": False, "from": None, "to": None})
+
+    def reset(self, key, window, page=0):
+        # start the sensor on a window: from the first page, or after `page` when the spooled pages up to it still hold
+        self._append(key, page, False, window)
+
+    def recordPage(self, key, page, results):
+        # spool the page's results, then journal it; a page is only counted as completed once both are written
+        path = self._pagePath(key, page)
+        os.makedirs(self.pagesDir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(results, f)
+        os.replace(tmp, path)
+        self._append(key, page, False)
+
+    def recordDone(self, key, page):
+        self._append(key, page, True)
+
+    def loadPages(self, key, upTo):
+        # results of pages 1..upTo from the spool, in page order
+        for page in range(1, upTo + 1):
+            with open(self._pagePath(key, page)) as f:
+                yield json.load(f)
+
+    def incomplete(self):
+        return [key for key, status in self.state.items() if not status["done"]]
+
+    def prune(self, keep):
+        # forget every sensor not in `keep` (dropped from the registry, or already loaded up to today): the journal is
+        # rewritten with one record per kept sensor and the other sensors' spooled pages are deleted
+        keep = set(keep)
+        with self.lock:
+            stale = [key for key in self.state if key not in keep]
+            if not stale:
+                return
+            for key in stale:
+                del self.state[key]
+            tmp = self.journalPath + ".tmp"
+            with open(tmp, "w") as f:
+                for key, status in self.state.items():
+                    f.write(json.dumps(self._record(key, status["page"], status["done"], (status["from"], status["to"]))) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journalPath) # a crash mid-rewrite leaves the old journal, never half a new one
+            kept = {os.path.basename(self._pagePath(key, 0)).split("-")[0] for key in self.state}
+            if os.path.isdir(self.pagesDir):
+                for name in os.listdir(self.pagesDir):
+                    if name.split("-")[0] not in kept:
+                        os.remove(os.path.join(self.pagesDir, name))
+
+def clearProgress(name="openaq_hours", root=PROGRESS_DIR):
+    # call once the fetched batch is loaded (watermarks saved), its progress is no longer needed
+    shutil.rmtree(os.path.join(root, name), ignore_errors=True)
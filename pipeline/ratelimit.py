@@ -0,0 +1,94 @@
+# Shared token-bucket scheduler for API calls.
+# Learns the quota from the x-ratelimit-* response headers and spaces requests out
+# evenly across the window instead of sleeping a fixed amount after every call.
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, limit=60, window=60, burst=5):
+        self.limit = limit # requests allowed per window (updated from x-ratelimit-limit)
+        self.window = window # window length in seconds, the current quota's entry in windows
+        self.windows = {} # quota limit -> longest x-ratelimit-reset seen under it, i.e. that quota's window length
+        self.burst = burst # max tokens saved up, small so calls stay spread across the window
+        self.tokens = float(min(burst, limit))
+        self.blockedUntil = 0.0 # monotonic time before which nobody may call (429 or quota used up)
+        self.calls = 0 # tokens handed out
+        self.throttled = 0 # 429 responses seen
+        self.waited = 0.0 # total seconds callers spent blocked in acquire(), summed over threads
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.limit / self.window # tokens per second
+
+    def _refill(self, now):
+        capacity = max(1, min(self.burst, self.limit))
+        self.tokens = min(capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        # blocks until a request may go out, then takes one token
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blockedUntil - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.calls += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def update(self, response):
+        # learn the quota from the response headers; the server's view always wins over ours
+        headers = response.headers
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            limit = _intHeader(headers, 'x-ratelimit-limit')
+            remaining = _intHeader(headers, 'x-ratelimit-remaining')
+            reset = _intHeader(headers, 'x-ratelimit-reset')
+            if limit:
+                self.limit = limit
+            if reset is not None:
+                # reset counts down to the end of the window, so the longest one seen under a quota is its window length.
+                # learned per quota: an hourly quota's long reset mustn't slow pacing once the per-minute one applies again
+                self.windows[self.limit] = max(self.windows.get(self.limit, 0), reset, 1)
+                self.window = self.windows[self.limit]
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset is not None:
+                    self.blockedUntil = max(self.blockedUntil, now + reset) # quota gone, wait for the window to roll over
+            if response.status_code == 429:
+                self.throttled += 1
+                retryAfter = _intHeader(headers, 'retry-after')
+                if retryAfter is None:
+                    retryAfter = reset if reset is not None else self.window
+                self.tokens = 0
+                self.blockedUntil = max(self.blockedUntil, now + retryAfter)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'tokens': round(self.tokens, 2),
+                'limit': self.limit,
+                'window': self.window,
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'waited_seconds': round(self.waited, 2),
+            }
+
+
+def _intHeader(headers, name):
+    value = headers.get(name)
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,146 @@
+# Dashboard rollup tables, maintained by the load step instead of views that re-aggregate daily_weather on every read.
+#   daily_city_rollup       one row per (city, date): avg temperature / pm25 of that UTC day (what temp_corr and pm25_daily_city_avg computed)
+#   pm25_city_delta_rollup  one row per city: latest and previous day's avg pm25 (what pm25_daily_city_delta computed)
+# After each batch only the city/day buckets the batch touched are recomputed, and only the touched cities' deltas,
+# so the dashboard reads are lookups on small tables whose cost doesn't grow with raw history.
+
+import time
+import pandas as pd
+from sqlalchemy import text, inspect
+
+from .load_postgres import _quote
+from .metrics import metrics, getLogger
+
+log = getLogger("rollups")
+
+DAILY_ROLLUP = "daily_city_rollup"
+DELTA_ROLLUP = "pm25_city_delta_rollup"
+
+def ensureRollups(engine, source="daily_weather"):
+    # create the rollup tables if missing, plus the source index the bucket recompute relies on.
+    # returns True if the rollups didn't exist yet (they then need a rebuildRollups to cover existing history)
+    created = not inspect(engine).has_table(DAILY_ROLLUP)
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {DAILY_ROLLUP} (
+                city TEXT NOT NULL,
+                date DATE NOT NULL,
+                avg_temp DOUBLE PRECISION,
+                avg_pm25 DOUBLE PRECISION,
+                temp_count INTEGER NOT NULL,
+                pm25_count INTEGER NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (city, date)
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {DELTA_ROLLUP} (
+                city TEXT PRIMARY KEY,
+                today DOUBLE PRECISION,
+                yesterday DOUBLE PRECISION,
+                today_date DATE,
+                yesterday_date DATE,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {_quote(source + '_city_hour_idx')} "
+            f"ON {_quote(source)} (sensor_city, {_quote('datetimeFrom_utc')})"
+        ))
+    return created
+
+def touchedBuckets(df, cityCol="sensor_city", timeCol="datetimeFrom_utc"):
+    # distinct (city, UTC day) pairs present in a batch
+    days = pd.to_datetime(df[timeCol], utc=True).dt.tz_convert(None).dt.floor("D")
+    return pd.DataFrame({"city": df[cityCol].astype(str), "day": days}).drop_duplicates().reset_index(drop=True)
+
+def _dailySelect(source, where):
+    return f"""
+        SELECT
+            w.sensor_city AS city,
+            DATE(w.{_quote('datetimeFrom_utc')}) AS date,
+            AVG(CASE WHEN w.parameter_name = 'temperature' THEN w.value END) AS avg_temp,
+            AVG(CASE WHEN w.parameter_name = 'pm25' THEN w.value END) AS avg_pm25,
+            COUNT(CASE WHEN w.parameter_name = 'temperature' THEN w.value END) AS temp_count,
+            COUNT(CASE WHEN w.parameter_name = 'pm25' THEN w.value END) AS pm25_count
+        FROM {_quote(source)} w
+        {where}
+        GROUP BY 1, 2
+    """
+
+# latest two days with pm25 for each listed city, read off the (city, date) primary key
+_DELTA_SELECT = f"""
+    SELECT c.city, d.today, d.yesterday, d.today_date, d.yesterday_date
+    FROM unnest(CAST(:cities AS TEXT[])) AS c(city)
+    CROSS JOIN LATERAL (
+        SELECT
+            (array_agg(r.avg_pm25 ORDER BY r.date DESC))[1] AS today,
+            (array_agg(r.avg_pm25 ORDER BY r.date DESC))[2] AS yesterday,
+            (array_agg(r.date ORDER BY r.date DESC))[1] AS today_date,
+            (array_agg(r.date ORDER BY r.date DESC))[2] AS yesterday_date
+        FROM (
+            SELECT date, avg_pm25 FROM {DAILY_ROLLUP}
+            WHERE city = c.city AND avg_pm25 IS NOT NULL
+            ORDER BY date DESC LIMIT 2
+        ) r
+    ) d
+    WHERE d.today IS NOT NULL
+"""
+
+def refreshRollups(engine, df, source="daily_weather", cityCol="sensor_city", timeCol="datetimeFrom_utc"):
+    # recompute the rollup rows for the buckets df touched, from what's now in source. Run after the batch is upserted.
+    # A bucket is deleted and re-inserted, so one that no longer has rows in source disappears from the rollup too.
+    # returns the number of daily buckets recomputed
+    if df.empty:
+        return 0
+    started = time.perf_counter()
+    buckets = touchedBuckets(df, cityCol, timeCol)
+    params = {"cities": buckets["city"].tolist(), "days": buckets["day"].dt.date.tolist()}
+    cities = sorted(buckets["city"].unique())
+    touched = "SELECT DISTINCT city, day FROM unnest(CAST(:cities AS TEXT[]), CAST(:days AS DATE[])) AS t(city, day)"
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            WITH touched AS ({touched})
+            DELETE FROM {DAILY_ROLLUP} r USING touched t WHERE r.city = t.city AND r.date = t.day
+        """), params)
+        # range predicate on the raw timestamp (not DATE(...) = day) so the (sensor_city, datetimeFrom_utc) index is used
+        conn.execute(text(f"""
+            WITH touched AS ({touched})
+            INSERT INTO {DAILY_ROLLUP} (city, date, avg_temp, avg_pm25, temp_count, pm25_count)
+        """ + _dailySelect(source, f"""
+            JOIN touched t ON w.sensor_city = t.city
+                AND w.{_quote('datetimeFrom_utc')} >= t.day
+                AND w.{_quote('datetimeFrom_utc')} < t.day + 1
+            WHERE w.parameter_name IN ('temperature', 'pm25')
+        """)), params)
+        _refreshDeltas(conn, cities)
+    seconds = time.perf_counter() - started
+    metrics.recordStage("rollups", seconds=seconds, rowsIn=len(df), rowsOut=len(buckets))
+    log.info("Rollups: %d city/day buckets, %d cities refreshed in %.2fs", len(buckets), len(cities), seconds)
+    return len(buckets)
+
+def rebuildRollups(engine, source="daily_weather"):
+    # recompute both rollups from all of source (first run, or after a full refresh replaced the table)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {DAILY_ROLLUP}"))
+        conn.execute(text(
+            f"INSERT INTO {DAILY_ROLLUP} (city, date, avg_temp, avg_pm25, temp_count, pm25_count)"
+            + _dailySelect(source, "WHERE w.parameter_name IN ('temperature', 'pm25')")
+        ))
+        conn.execute(text(f"DELETE FROM {DELTA_ROLLUP}"))
+        cities = [row[0] for row in conn.execute(text(f"SELECT DISTINCT city FROM {DAILY_ROLLUP}"))]
+        _refreshDeltas(conn, cities)
+    seconds = time.perf_counter() - started
+    metrics.recordStage("rollups", seconds=seconds)
+    log.info("Rollups rebuilt for %d cities in %.2fs", len(cities), seconds)
+
+def _refreshDeltas(conn, cities):
+    if not cities:
+        return
+    params = {"cities": list(cities)}
+    conn.execute(text(f"DELETE FROM {DELTA_ROLLUP} WHERE city = ANY(CAST(:cities AS TEXT[]))"), params)
+    conn.execute(text(
+        f"INSERT INTO {DELTA_ROLLUP} (city, today, yesterday, today_date, yesterday_date)" + _DELTA_SELECT
+    ), params)
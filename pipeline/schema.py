@@ -0,0 +1,55 @@
+# Column dtypes for the pipeline frames, applied as soon as a frame is built (normalizeHours, getOpenMeteoData) and again on the
+# way into mergeDataframes/cleaned_data, where it's a no-op for columns that already have their dtype.
+#   low-cardinality strings (cities, stations, parameters, units, timezones, period labels) -> categoricals: a small integer code per
+#     row instead of a Python str object, and groupbys/merges on them work on the codes
+#   other string columns -> Arrow-backed strings when pyarrow is installed (the lake needs it anyway), left as object otherwise
+#   numbers are left alone: Open-Meteo's float32 stays float32, OpenAQ's measurements stay float64 as reported
+# Categoricals hash like the strings they hold, so unique_id (keys.rowKeys) doesn't change.
+
+import pandas as pd
+
+try:
+    import pyarrow # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = None
+
+CATEGORY_COLUMNS = {
+    # raw OpenAQ hours + sensor metadata (normalizeHours) and Open-Meteo frames
+    'City', 'Station Name', 'Timezone', 'First Seen (UTC)',
+    'parameter.name', 'parameter.units', 'parameter.displayName',
+    'period.label', 'period.interval', 'coverage.expectedInterval', 'coverage.observedInterval',
+    # the same columns after cleaned_data's renames, plus the merged timezone
+    'sensor_city', 'sensor_station_name', 'parameter_name', 'parameter_units', 'parameter_displayName',
+    'period_label', 'period_interval', 'coverage_expectedInterval', 'coverage_observedInterval', 'timezone',
+}
+
+def _isStrings(values):
+    return values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == 'string'
+
+def compactFrame(df):
+    # converts df's columns in place (and returns it); columns holding anything but strings (dicts, Timestamps) are left as they are
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if col in CATEGORY_COLUMNS and (_isStrings(values) or isinstance(values.dtype, pd.StringDtype)):
+            df[col] = values.astype('category')
+        elif STRING_DTYPE is not None and _isStrings(values):
+            df[col] = values.astype(STRING_DTYPE)
+    return df
+
+def alignCategories(left, leftCol, right, rightCol):
+    # gives two categorical key columns the same categories, so a merge on them joins on the codes
+    # (pandas falls back to comparing the strings when the categories differ)
+    if not (isinstance(left[leftCol].dtype, pd.CategoricalDtype) and isinstance(right[rightCol].dtype, pd.CategoricalDtype)):
+        return
+    categories = left[leftCol].cat.categories.union(right[rightCol].cat.categories)
+    left[leftCol] = left[leftCol].cat.set_categories(categories)
+    right[rightCol] = right[rightCol].cat.set_categories(categories)
+
+def storageFrame(df):
+    # categoricals back to plain strings for Parquet, so batches written before and after compactFrame share one schema
+    # (a dictionary column and a string column don't unify when the lake is read back). Always returns a copy
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    return df.assign(**{col: df[col].astype(STRING_DTYPE or object) for col in categorical})
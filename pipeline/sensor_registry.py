@@ -0,0 +1,79 @@
+# Local registry of OpenAQ sensors (id, station, coordinates, parameter, first/last seen) kept on disk between runs,
+# with a grid-bucket spatial index so "active sensors within R km of a point" is answered in memory.
+# The registry is filled from /locations by refreshSensorRegistry() in ingestion_openaq; nothing here calls the API.
+
+import os
+import numpy as np
+import pandas as pd
+
+REGISTRY_PATH = os.getenv("ZEPHYR_SENSOR_REGISTRY", ".state/sensor_registry.parquet")
+COLUMNS = ['Sensor ID', 'Location ID', 'Station Name', 'Latitude', 'Longitude', 'Timezone', 'Parameter',
+           'First Seen (UTC)', 'Last Seen (UTC)', 'Refreshed (UTC)']
+EARTH_RADIUS_KM = 6371.0088
+
+def loadRegistry(path=REGISTRY_PATH):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_parquet(path)
+
+def saveRegistry(registry, path=REGISTRY_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    registry.to_parquet(tmp, index=False)
+    os.replace(tmp, path) # atomic swap so a crash mid-write keeps the old registry
+
+def mergeRegistry(registry, fresh):
+    # incremental refresh: new sensors are added, known ones get their latest metadata/last seen,
+    # sensors missing from this refresh are kept (their old last seen ages them out of "active")
+    fresh = fresh.copy()
+    fresh['First Seen (UTC)'] = pd.to_datetime(fresh['First Seen (UTC)'], utc=True, errors='coerce')
+    fresh['Last Seen (UTC)'] = pd.to_datetime(fresh['Last Seen (UTC)'], utc=True, errors='coerce')
+    fresh['Refreshed (UTC)'] = pd.Timestamp.now(tz='UTC')
+    if registry.empty:
+        return fresh[COLUMNS].reset_index(drop=True)
+    merged = pd.concat([registry[COLUMNS], fresh[COLUMNS]], ignore_index=True)
+    firstSeen = merged.groupby('Sensor ID')['First Seen (UTC)'].min()
+    merged = merged.drop_duplicates('Sensor ID', keep='last').reset_index(drop=True)
+    merged['First Seen (UTC)'] = merged['Sensor ID'].map(firstSeen)
+    return merged
+
+def isStale(registry, maxAgeHours=24):
+    if registry.empty:
+        return True
+    return pd.Timestamp.now(tz='UTC') - registry['Refreshed (UTC)'].max() > pd.Timedelta(hours=maxAgeHours)
+
+def haversineKm(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class SensorIndex:
+    # buckets sensors into cellDeg x cellDeg lat/lon cells; a radius query only looks at the cells its bounding box touches
+    def __init__(self, registry, cellDeg=0.25):
+        self.registry = registry.reset_index(drop=True)
+        self.cellDeg = cellDeg
+        self.lats = self.registry['Latitude'].to_numpy(dtype=float)
+        self.lons = self.registry['Longitude'].to_numpy(dtype=float)
+        cells = pd.DataFrame({
+            'i': np.floor(self.lats / cellDeg).astype(int),
+            'j': np.floor(self.lons / cellDeg).astype(int),
+        })
+        self.buckets = {cell: rows.to_numpy() for cell, rows in cells.groupby(['i', 'j']).groups.items()}
+
+    def query(self, lat, lon, radiusKm, activeSince=None):
+        # registry rows within radiusKm of (lat, lon), nearest first, with a 'Distance (km)' column.
+        # activeSince keeps only sensors last seen at or after that time
+        dLat = radiusKm / 111.32
+        dLon = radiusKm / (111.32 * max(np.cos(np.radians(lat)), 1e-6))
+        iRange = range(int(np.floor((lat - dLat) / self.cellDeg)), int(np.floor((lat + dLat) / self.cellDeg)) + 1)
+        jRange = range(int(np.floor((lon - dLon) / self.cellDeg)), int(np.floor((lon + dLon) / self.cellDeg)) + 1)
+        candidates = [self.buckets[(i, j)] for i in iRange for j in jRange if (i, j) in self.buckets]
+        if not candidates:
+            return self.registry.iloc[0:0].assign(**{'Distance (km)': []})
+        rows = np.concatenate(candidates)
+        distance = haversineKm(lat, lon, self.lats[rows], self.lons[rows])
+        keep = distance <= radiusKm
+        found = self.registry.iloc[rows[keep]].assign(**{'Distance (km)': distance[keep]})
+        if activeSince is not None:
+            found = found[found['Last Seen (UTC)'] >= activeSince]
+        return found.sort_values('Distance (km)', kind='stable')
@@ -0,0 +1,22 @@
+# Time normalization shared by the transforms: every time column is parsed once, to UTC, with an explicit format,
+# and local times are derived from a UTC instant + timezone column one timezone at a time instead of row by row.
+
+import pandas as pd
+
+OPENAQ_UTC_FORMAT = '%Y-%m-%dT%H:%M:%SZ' # e.g. 2025-08-24T18:00:00Z
+
+def toUtc(values, fmt='ISO8601'):
+    # tz-aware UTC datetimes; columns that are already datetimes are converted, not re-parsed
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        return values.dt.tz_convert('UTC')
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        return values.dt.tz_localize('UTC')
+    return pd.to_datetime(values, utc=True, format=fmt, errors='coerce')
+
+def localWallTime(instants, timezones):
+    # local wall-clock time (tz-naive) for UTC instants, each row in its own timezone.
+    # one tz_convert per distinct timezone, so the cost is per timezone rather than per row
+    out = pd.Series(pd.NaT, index=instants.index, dtype='datetime64[ns]')
+    for tzname, idx in instants.groupby(timezones, sort=False, observed=True).groups.items():
+        out.loc[idx] = instants.loc[idx].dt.tz_convert(tzname).dt.tz_localize(None)
+    return out
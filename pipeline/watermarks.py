@@ -0,0 +1,61 @@
+# Persisted high-water marks so each run only fetches, transforms and loads hours we don't already have.
+# openaq marks are per sensor (last loaded datetimeTo_utc), openmeteo marks are per city (last loaded hourly_datetime_utc).
+
+import json
+import os
+import pandas as pd
+
+WATERMARK_PATH = os.getenv("ZEPHYR_WATERMARKS", ".state/watermarks.json")
+
+def loadWatermarks(path=WATERMARK_PATH):
+    marks = {"openaq": {}, "openmeteo": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            marks.update(json.load(f))
+    return marks
+
+def getWatermark(marks, source, key):
+    # UTC timestamp of the last loaded hour for this sensor/city, or None if we've never loaded it
+    value = marks.get(source, {}).get(str(key))
+    return pd.Timestamp(value) if value else None
+
+def weatherWatermark(marks, city, sensorIds=()):
+    # where a city's weather fetch starts: its own mark, held back to its furthest-behind sensor so that sensor's catch-up hours
+    # still have weather to join against in cleaned_data (otherwise they'd be dropped while the sensor's mark moves on). None = whole window
+    mark = getWatermark(marks, "openmeteo", city)
+    for sensor_id in sensorIds:
+        sensorMark = getWatermark(marks, "openaq", sensor_id)
+        if mark is None or sensorMark is None:
+            return None
+        mark = min(mark, sensorMark - pd.Timedelta(hours=1)) # sensor marks are the end of the last loaded hour, weather hours are keyed on their start
+    return mark
+
+def collectWatermarks(openAQ, cleaned, skipSensors=()):
+    # new marks from a batch: per sensor from the raw OpenAQ hours, per city from what actually made it into cleaned.
+    # skipSensors (sensors whose fetch didn't finish) keep their old marks so a resumed run still covers their whole window
+    marks = {"openaq": {}, "openmeteo": {}}
+    if not openAQ.empty:
+        sensorCol = 'sensor_id' if 'sensor_id' in openAQ.columns else 'Sensor ID' # cleaned_data renames these in place
+        toCol = 'datetimeTo_utc' if 'datetimeTo_utc' in openAQ.columns else 'period.datetimeTo.utc'
+        last = pd.to_datetime(openAQ[toCol], utc=True, errors='coerce').groupby(openAQ[sensorCol], observed=True).max().dropna()
+        skip = {str(s) for s in skipSensors}
+        marks["openaq"] = {str(k): v.isoformat() for k, v in last.items() if str(k) not in skip}
+    if not cleaned.empty:
+        last = cleaned.groupby('sensor_city', observed=True)['hourly_datetime_utc'].max().dropna()
+        marks["openmeteo"] = {str(k): v.isoformat() for k, v in last.items()}
+    return marks
+
+def saveWatermarks(newMarks, path=WATERMARK_PATH):
+    # only call this once the batch is loaded; marks only ever move forward
+    marks = loadWatermarks(path)
+    for source, values in newMarks.items():
+        current = marks.setdefault(source, {})
+        for key, value in values.items():
+            if key not in current or pd.Timestamp(value) > pd.Timestamp(current[key]):
+                current[key] = value
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(marks, f, indent=2, sort_keys=True)
+    os.replace(tmp, path) # atomic swap so a crash mid-write can't corrupt the marks
+    return marks